@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NodeLoc 本地基准测试服务器 - 模拟 Discourse 站点与通知渠道
+提供: /session/csrf, /session, /session/current.json, /u/<用户名>/summary.json, /latest(.json), /t/<slug>/<id>, /checkin, /assets/app.js (站内路由),
+      以及 Telegram / Gotify / Server酱³ / 自定义微信 的通知接口
+用法: python3 bench/fixture_server.py --port 8080 --latency-ms 50
+"""
+
+import os
+import re
+import json
+import time
+import html
+import hashlib
+import calendar
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SESSION_COOKIE = "_t"
+SESSION_TOKEN = "bench-session-token"
+
+
+def _load(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class Fixtures:
+    """读取录制的接口数据与页面模板"""
+
+    def __init__(self, boot_ms: int = 300):
+        self.boot_ms = boot_ms
+        self.json = {
+            name: _load(f"{name}.json")
+            for name in ("csrf", "session", "current", "summary", "latest", "checkin")
+        }
+        self.latest_html = _load("latest.html")
+        self.topic_html = _load("topic.html")
+        self.app_js = _load("app.js")
+        self.topics = {t["id"]: t for t in json.loads(self.json["latest"])["topic_list"]["topics"]}
+        self.latest_etag = f'W/"{hashlib.md5(self.json["latest"].encode()).hexdigest()}"'
+
+    def render_latest(self) -> str:
+        rows = []
+        for t in self.topics.values():
+            bumped_ms = calendar.timegm(time.strptime(t["bumped_at"][:19], "%Y-%m-%dT%H:%M:%S")) * 1000
+            rows.append(
+                f'      <tr class="topic-list-item" data-topic-id="{t["id"]}">'
+                f'<td class="main-link"><span class="link-top-line">'
+                f'<a class="title raw-link raw-topic-link" href="/t/{t["slug"]}/{t["id"]}">{html.escape(t["title"])}</a>'
+                f'</span></td>'
+                f'<td class="num posts-map posts"><span class="number">{t["posts_count"]}</span></td>'
+                f'<td class="activity"><span class="relative-date" data-time="{bumped_ms}">1h</span></td>'
+                f'</tr>'
+            )
+        return (self.latest_html
+                .replace("{{TOPIC_ROWS}}", "\n".join(rows))
+                .replace("{{BOOT_MS}}", str(self.boot_ms)))
+
+    def render_topic(self, topic_id: int) -> str:
+        t = self.topics.get(topic_id)
+        if not t:
+            return None
+        posts = []
+        for n in range(1, min(t["posts_count"], 10) + 1):
+            post_id = topic_id * 100 + n
+            posts.append(
+                f'      <article class="topic-post" id="post_{n}" data-post-id="{post_id}">'
+                f'<div class="cooked"><p>第 {n} 楼的内容</p></div>'
+                f'<nav class="post-controls">'
+                f'<div class="discourse-reactions-reaction-button" data-post-id="{post_id}">♥</div>'
+                f'</nav></article>'
+            )
+        return (self.topic_html
+                .replace("{{TOPIC_ID}}", str(topic_id))
+                .replace("{{TITLE}}", html.escape(t["title"]))
+                .replace("{{POSTS}}", "\n".join(posts))
+                .replace("{{BOOT_MS}}", str(self.boot_ms)))
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server_version = "nodeloc-bench"
+    protocol_version = "HTTP/1.1"
+
+    # ---------------- helpers ----------------
+    def _send(self, status: int, body: str = "", content_type: str = "application/json", headers: dict = None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _logged_in(self) -> bool:
+        return f"{SESSION_COOKIE}={SESSION_TOKEN}" in (self.headers.get("Cookie") or "")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _handle(self):
+        self.server.count(self.command, self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.command in ("POST", "PUT"):
+            self._read_body()
+
+        fixtures = self.server.fixtures
+        path = urlparse(self.path).path
+        route = (self.command, path)
+
+        # ---------------- Discourse ----------------
+        if route == ("GET", "/session/csrf"):
+            return self._send(200, fixtures.json["csrf"])
+        if route == ("POST", "/session"):
+            cookie = f"{SESSION_COOKIE}={SESSION_TOKEN}; Path=/; HttpOnly; Max-Age=86400"
+            return self._send(200, fixtures.json["session"], headers={"Set-Cookie": cookie})
+        if route == ("GET", "/session/current.json"):
+            if not self._logged_in():
+                return self._send(404, '{"errors": ["not found"]}')
+            return self._send(200, fixtures.json["current"])
+        if self.command == "GET" and re.match(r"^/u/[^/]+/summary\.json$", path):
+            if not self._logged_in():
+                return self._send(403, '{"errors": ["not allowed"]}')
+            return self._send(200, fixtures.json["summary"])
+        if route == ("GET", "/latest.json"):
+            if self.headers.get("If-None-Match") == fixtures.latest_etag:
+                return self._send(304, headers={"ETag": fixtures.latest_etag})
+            return self._send(200, fixtures.json["latest"], headers={"ETag": fixtures.latest_etag})
+        if route == ("POST", "/checkin"):
+            if self.server.checked_in:
+                return self._send(200, '{"success": "OK", "message": "已经签到过了"}')
+            self.server.checked_in = True
+            return self._send(200, fixtures.json["checkin"])
+        if self.command == "GET" and path in ("/", "/latest"):
+            return self._send(200, fixtures.render_latest(), "text/html")
+        m = re.match(r"^/t/[^/]+/(\d+)", path)
+        if self.command == "GET" and m:
+            page = fixtures.render_topic(int(m.group(1)))
+            if page is None:
+                return self._send(404, "not found", "text/plain")
+            return self._send(200, page, "text/html")
+        if self.command in ("POST", "PUT") and (path == "/posts" or path.startswith("/discourse-reactions/")):
+            return self._send(200, '{"success": "OK"}')
+        if path == "/assets/app.js":
+            return self._send(200, fixtures.app_js, "application/javascript")
+        if path.startswith("/assets/"):
+            content_type = "text/css" if path.endswith(".css") else "application/javascript"
+            return self._send(200, "/* bench asset */", content_type)
+        if path.startswith(("/user_avatar/", "/letter_avatar", "/images/")):
+            return self._send(200, "", "image/png")
+
+        # ---------------- 通知渠道 ----------------
+        if self.command == "POST" and re.match(r"^/bot[^/]+/sendMessage$", path):
+            return self._send(200, '{"ok": true}')
+        if route == ("POST", "/message"):
+            return self._send(200, '{"id": 1}')
+        if self.command == "GET" and path.startswith("/send/"):
+            return self._send(200, '{"code": 0}')
+        if path == "/wxsend":
+            return self._send(200, '{"ok": true}')
+
+        return self._send(404, '{"errors": ["not found"]}')
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """在后台线程运行的本地站点, 记录每个接口的请求次数"""
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency_ms: int = 0, boot_ms: int = 300):
+        super().__init__(("127.0.0.1", port), FixtureHandler)
+        self.fixtures = Fixtures(boot_ms=boot_ms)
+        self.latency = latency_ms / 1000
+        self.checked_in = False
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, method: str, path: str):
+        key = f"{method} {re.sub(r'/[0-9]+', '/<id>', urlparse(path).path)}"
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NodeLoc 本地基准测试服务器")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=int, default=50, help="每个请求的模拟网络延迟")
+    parser.add_argument("--boot-ms", type=int, default=300, help="模拟 Discourse 启动遮罩的持续时间")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.port, args.latency_ms, args.boot_ms)
+    print(f"fixture server: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+// 模拟 Discourse 客户端: 签到/点赞/回复交互, 以及 require('discourse/lib/url') 站内路由
+(function () {
+  function bindPage() {
+    var checkin = document.querySelector("button.checkin-button");
+    if (checkin) {
+      checkin.addEventListener("click", function () {
+        fetch("/checkin", {method: "POST"}).then(function () {
+          checkin.title = "已签到";
+          checkin.setAttribute("aria-label", "已签到");
+          checkin.textContent = "签✓";
+        });
+      });
+    }
+
+    document.querySelectorAll(".discourse-reactions-reaction-button").forEach(function (btn) {
+      btn.addEventListener("click", function () {
+        fetch("/discourse-reactions/posts/" + btn.dataset.postId + "/custom-reactions/heart/toggle.json", {method: "PUT"});
+        btn.classList.add("has-reaction");
+      });
+    });
+
+    var reply = document.querySelector("button.reply.create");
+    if (reply) {
+      reply.addEventListener("click", function () {
+        document.getElementById("reply-control").classList.remove("closed");
+      });
+    }
+  }
+
+  var composer = document.getElementById("reply-control");
+  composer.querySelector("button.create").addEventListener("click", function () {
+    var topic = document.getElementById("topic");
+    var raw = composer.querySelector(".d-editor-input").value;
+    fetch("/posts", {method: "POST", body: new URLSearchParams({raw: raw, topic_id: topic ? topic.dataset.topicId : ""})}).then(function () {
+      composer.classList.add("closed");
+    });
+  });
+
+  // 站内路由: 只替换 #main-outlet, 不重新加载整个应用
+  function routeTo(path) {
+    fetch(path).then(function (r) { return r.text(); }).then(function (html) {
+      var doc = new DOMParser().parseFromString(html, "text/html");
+      document.getElementById("main-outlet").replaceWith(doc.getElementById("main-outlet"));
+      document.title = doc.title;
+      history.pushState({}, "", path);
+      window.scrollTo(0, 0);
+      bindPage();
+    });
+    return true;
+  }
+
+  window.require = function (name) {
+    if (name !== "discourse/lib/url") throw new Error("Could not find module `" + name + "`");
+    return {default: {routeTo: routeTo}};
+  };
+
+  bindPage();
+})();
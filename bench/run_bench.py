@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NodeLoc 离线基准测试 - 在本地模拟站点上端到端运行 NodeLocUpgrade.run()
+输出: 各阶段耗时、峰值内存、WebDriver 往返次数、模拟站点请求数
+用法: python3 bench/run_bench.py --engine browser --engine http --topics 5 --repeat 3
+      python3 bench/run_bench.py --compare NODELOC_LOW_MEMORY=1 --topics 10   (前后对比)
+每次运行都在独立子进程中进行, 互不影响内存与模块级配置
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import importlib.util
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from fixture_server import FixtureServer  # noqa: E402
+
+SCRIPT_PATH = os.path.join(os.path.dirname(BENCH_DIR), "odeloc_upgrade_selenium.py")
+RESULT_PREFIX = "BENCH_RESULT "
+PROXY_ENV_KEYS = ("NODELOC_PROXY", "LINUXDO_PROXY", "HTTP_PROXY", "HTTPS_PROXY", "http_proxy", "https_proxy")
+
+
+class ScaledTime:
+    """按比例缩放 time.sleep, 用于去掉脚本中刻意的随机停顿 (其余属性透传 time 模块)"""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds * self.scale, 0.01) if seconds else 0)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _bench_env(server_url: str, workdir: str, engine: str, extra: list) -> dict:
+    """把站点与所有通知渠道指向本地模拟服务器, 状态文件放到临时目录"""
+    env = {
+        "NODELOC_HOME_URL": server_url,
+        "NODELOC_ENGINE": engine,
+        "NODELOC_USERNAME": "bench",
+        "NODELOC_PASSWORD": "bench",
+        "NODELOC_SESSION_CACHE": os.path.join(workdir, "session.json"),
+        "NODELOC_NOTIFY_OUTBOX": os.path.join(workdir, "outbox.json"),
+        "NODELOC_METRICS_FILE": os.path.join(workdir, "spans.jsonl"),
+        "NODELOC_TOPIC_CACHE": os.path.join(workdir, "topics.db"),
+        "NODELOC_STATE_FILE": os.path.join(workdir, "state.json"),
+        "NODELOC_SELECTOR_STATE": os.path.join(workdir, "selectors.json"),
+        "NODELOC_DEBUG_DIR": os.path.join(workdir, "debug"),
+        "TG_BOT_TOKEN": "bench",
+        "TG_CHAT_ID": "1",
+        "TG_API_BASE": server_url,
+        "GOTIFY_URL": server_url,
+        "GOTIFY_TOKEN": "bench",
+        "SC3_PUSH_KEY": "sct1tbench",
+        "SC3_API_URL": server_url + "/send/{key}",
+        "WECHAT_API_URL": server_url + "/wxsend",
+        "WECHAT_AUTH_TOKEN": "bench",
+    }
+    for item in extra:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def run_child(args) -> dict:
+    """在当前进程内启动模拟站点并完整运行一次 run()"""
+    server = FixtureServer(latency_ms=args.latency_ms, boot_ms=args.boot_ms).start()
+    workdir = tempfile.mkdtemp(prefix="nodeloc-bench-")
+    for key in PROXY_ENV_KEYS:
+        os.environ.pop(key, None)
+    os.environ.update(_bench_env(server.url, workdir, args.engine, args.env))
+
+    random.seed(args.seed)
+    tracemalloc.start()
+
+    spec = importlib.util.spec_from_file_location("nodeloc_upgrade", args.script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.DAILY_TASKS["topics_to_browse"] = args.topics
+    module.time = ScaledTime(args.pacing)
+
+    webdriver_calls = {}
+
+    class BenchUpgrade(module.NodeLocUpgrade):
+        """统计每条 WebDriver 命令 (CDP 后端为 DevTools 命令) 的往返次数"""
+
+        def start_browser(self):
+            super().start_browser()
+            execute = self.driver.execute
+
+            def counted_execute(command, params=None, **kwargs):
+                webdriver_calls[command] = webdriver_calls.get(command, 0) + 1
+                return execute(command, params, **kwargs)
+
+            self.driver.execute = counted_execute
+
+    bench = BenchUpgrade("bench", "bench")
+    start = time.time()
+    try:
+        exit_code = bench.run()
+    finally:
+        wall = time.time() - start
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    phases = {}
+    for span in bench.spans:
+        phases.setdefault(span["phase"], []).append(span["duration"])
+
+    return {
+        "engine": args.engine,
+        "env": args.env,
+        "exit_code": exit_code,
+        "wall_seconds": round(wall, 3),
+        "phases": {
+            phase: {
+                "count": len(durations),
+                "total": round(sum(durations), 3),
+                "p50": round(statistics.median(durations), 3),
+                "max": round(max(durations), 3),
+            }
+            for phase, durations in phases.items()
+        },
+        "webdriver_calls": {"total": sum(webdriver_calls.values()), "by_command": webdriver_calls},
+        "memory_kb": {
+            "python_peak": python_peak // 1024,
+            "maxrss_self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "maxrss_children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            "browser_tree_peak": bench.memory_watchdog.peak_kb,
+        },
+        "site_requests": server.requests,
+        "stats": bench.stats,
+    }
+
+
+def _spawn(args, engine: str, env: list, seed: int) -> dict:
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--child",
+        "--engine", engine,
+        "--topics", str(args.topics),
+        "--pacing", str(args.pacing),
+        "--latency-ms", str(args.latency_ms),
+        "--boot-ms", str(args.boot_ms),
+        "--seed", str(seed),
+        "--script", args.script,
+    ]
+    for item in env:
+        cmd += ["--env", item]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    sys.stderr.write(proc.stderr[-3000:])
+    raise RuntimeError(f"基准测试子进程失败 (engine={engine}, exit={proc.returncode})")
+
+
+def _summarize(results: list) -> dict:
+    """同一配置多次运行取中位数"""
+    phases = {}
+    for r in results:
+        for phase, data in r["phases"].items():
+            phases.setdefault(phase, []).append(data["total"])
+    return {
+        "runs": len(results),
+        "ok": sum(1 for r in results if r["exit_code"] == 0),
+        "wall_p50": statistics.median(r["wall_seconds"] for r in results),
+        "wall_p95": _percentile([r["wall_seconds"] for r in results], 95),
+        "phases_p50": {phase: statistics.median(v) for phase, v in phases.items()},
+        "webdriver_calls_p50": statistics.median(r["webdriver_calls"]["total"] for r in results),
+        "maxrss_self_kb_max": max(r["memory_kb"]["maxrss_self"] for r in results),
+        "maxrss_children_kb_max": max(r["memory_kb"]["maxrss_children"] for r in results),
+        "python_peak_kb_max": max(r["memory_kb"]["python_peak"] for r in results),
+        "browser_tree_peak_kb_max": max(r["memory_kb"]["browser_tree_peak"] for r in results),
+    }
+
+
+def _print_report(summaries: dict):
+    for label, summary in summaries.items():
+        print(f"\n=== {label} ({summary['ok']}/{summary['runs']} 成功) ===")
+        print(f"  总耗时 p50/p95     : {summary['wall_p50']:.2f}s / {summary['wall_p95']:.2f}s")
+        print(f"  WebDriver 往返 p50 : {summary['webdriver_calls_p50']:.0f}")
+        print(f"  峰值内存 (KB)      : 进程 {summary['maxrss_self_kb_max']} | "
+              f"浏览器进程树 {summary['browser_tree_peak_kb_max']} | "
+              f"子进程 {summary['maxrss_children_kb_max']} | Python 堆 {summary['python_peak_kb_max']}")
+        for phase, seconds in summary["phases_p50"].items():
+            print(f"    {phase:<24} {seconds:>8.3f}s")
+
+
+def _print_comparison(before: dict, after: dict, change: str):
+    """同一引擎在附加 --compare 前后的对比 (取各自的 p50 / 峰值)"""
+    rows = [
+        ("总耗时 p50 (s)", before["wall_p50"], after["wall_p50"]),
+        ("总耗时 p95 (s)", before["wall_p95"], after["wall_p95"]),
+        ("浏览器进程树峰值 (KB)", before["browser_tree_peak_kb_max"], after["browser_tree_peak_kb_max"]),
+        ("子进程峰值 (KB)", before["maxrss_children_kb_max"], after["maxrss_children_kb_max"]),
+        ("WebDriver 往返 p50", before["webdriver_calls_p50"], after["webdriver_calls_p50"]),
+    ]
+    print(f"\n--- 对比: {change} ---")
+    print(f"  {'指标':<20}{'之前':>12}{'之后':>12}{'变化':>9}")
+    for name, old, new in rows:
+        delta = f"{new / old - 1:+.0%}" if old else "-"
+        print(f"  {name:<20}{old:>12.2f}{new:>12.2f}{delta:>9}")
+    print(f"  成功次数: {before['ok']}/{before['runs']} -> {after['ok']}/{after['runs']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NodeLoc 离线基准测试")
+    parser.add_argument("--engine", action="append", choices=["browser", "http"],
+                        help="要测试的运行引擎, 可重复指定 (默认 browser)")
+    parser.add_argument("--topics", type=int, default=5, help="每次运行处理的主题数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个配置重复运行次数")
+    parser.add_argument("--pacing", type=float, default=0.0,
+                        help="随机停顿的缩放比例, 0 表示去掉停顿只测引擎开销, 1 表示与线上一致")
+    parser.add_argument("--latency-ms", type=int, default=50, help="模拟站点每个请求的网络延迟")
+    parser.add_argument("--boot-ms", type=int, default=300, help="模拟 Discourse 启动遮罩的持续时间")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="附加给被测脚本的环境变量, 可重复指定")
+    parser.add_argument("--compare", action="append", default=[], metavar="KEY=VALUE",
+                        help="再附加这些环境变量运行一遍, 输出前后对比 (如 NODELOC_LOW_MEMORY=1), 可重复指定")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--script", default=SCRIPT_PATH, help="被测脚本路径")
+    parser.add_argument("--json", dest="json_out", help="把全部原始结果写入 JSON 文件")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.engine = args.engine[0] if args.engine else "browser"
+        result = run_child(args)
+        print(RESULT_PREFIX + json.dumps(result, ensure_ascii=False))
+        return
+
+    engines = args.engine or ["browser"]
+    variants = [args.env] + ([args.env + args.compare] if args.compare else [])
+    raw, summaries, pairs = {}, {}, []
+    for engine in engines:
+        labels = []
+        for env in variants:
+            label = engine + (f" {' '.join(env)}" if env else "")
+            raw[label] = [_spawn(args, engine, env, args.seed + i) for i in range(args.repeat)]
+            summaries[label] = _summarize(raw[label])
+            labels.append(label)
+        if args.compare:
+            pairs.append(labels)
+
+    _print_report(summaries)
+    for before, after in pairs:
+        _print_comparison(summaries[before], summaries[after], f"{before} -> {' '.join(args.compare)}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"summary": summaries, "runs": raw}, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,33 +10,84 @@ NodeLoc 快速升级脚本 - Selenium 版本（用户名密码登录）
 """
 
 import os
+import json
+import asyncio
 import time
 import random
 import re
 import traceback
+import subprocess
+import threading
 import functools
+import contextlib
+import socket
+import sqlite3
+import gzip
+import base64
+import select
+import shutil
+import tempfile
+import signal
+import argparse
+import datetime
+from http.cookiejar import Cookie
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, wait
 from loguru import logger
-from curl_cffi import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from curl_cffi import requests, CurlError, CurlECode, CurlInfo, CurlWsFlag
+from curl_cffi.requests import AsyncSession
+from urllib.parse import urlparse
 
-HOME_URL = "https://www.nodeloc.com"
-LOGIN_URL = "https://www.nodeloc.com/login"
-SESSION_URL = "https://www.nodeloc.com/session"
-CSRF_URL = "https://www.nodeloc.com/session/csrf"
+# Selenium 在预检通过、真正需要浏览器时才导入 (见 start_browser 等方法内的局部导入)
 
-DEBUG_HTML = "/ql/data/scripts/nodeloc_upgrade_debug.html"
-DEBUG_PNG = "/ql/data/scripts/nodeloc_upgrade_debug.png"
+# 站点地址 (可通过 NODELOC_HOME_URL 指向本地基准测试服务器)
+HOME_URL = (os.environ.get("NODELOC_HOME_URL") or "https://www.nodeloc.com").rstrip("/")
+LOGIN_URL = f"{HOME_URL}/login"
+SESSION_URL = f"{HOME_URL}/session"
+CSRF_URL = f"{HOME_URL}/session/csrf"
+CURRENT_SESSION_URL = f"{HOME_URL}/session/current.json"
+LATEST_JSON_URL = f"{HOME_URL}/latest.json"
+USER_SUMMARY_URL = f"{HOME_URL}/u/{{username}}/summary.json"
+# 签到接口 (签到插件的 API 地址, 如站点调整可通过环境变量覆盖)
+CHECKIN_URL = os.environ.get("NODELOC_CHECKIN_URL") or f"{HOME_URL}/checkin"
+# 签到插件在 /session/current.json 的 current_user 中表示"今日已签到"的字段名 (站点返回中确认过再填写),
+# 为空时不预先查询签到状态
+CHECKIN_STATUS_FIELD = os.environ.get("NODELOC_CHECKIN_STATUS_FIELD", "").strip()
+
+# 调试快照: 出错时在后台写入带时间戳的压缩 HTML/截图, 目录超过上限时删除最旧的文件, 留空关闭
+DEBUG_DIR = os.environ.get("NODELOC_DEBUG_DIR", "/ql/data/scripts/nodeloc_debug").strip()
+DEBUG_MAX_MB = float(os.environ.get("NODELOC_DEBUG_MAX_MB") or 20)
+DEBUG_MHTML = os.environ.get("NODELOC_DEBUG_MHTML", "0") == "1"  # 用 CDP 保存单文件 MHTML 代替 page_source
+
+# 会话缓存 (保存登录 Cookie, 下次运行校验通过即可跳过登录)
+SESSION_CACHE_FILE = os.environ.get("NODELOC_SESSION_CACHE") or "/ql/data/scripts/nodeloc_session.json"
+SESSION_CACHE_TTL_HOURS = float(os.environ.get("NODELOC_SESSION_TTL_HOURS") or 72)
+
+# 主题缓存 (SQLite): 记录主题与访问时间, 列表只增量拉取变化的主题, 留空关闭
+TOPIC_CACHE_DB = os.environ.get("NODELOC_TOPIC_CACHE", "/ql/data/scripts/nodeloc_topics.db").strip()
+TOPIC_CACHE_MAX_PAGES = 5  # 增量拉取 /latest.json 的最大页数
+TOPIC_CACHE_KEEP_DAYS = 30  # 超过该天数未再出现在列表中的主题会被清理
+
+# 选择器排名: 记录每类元素上次命中的选择器, 下次优先尝试, 留空则只在本次运行内生效
+SELECTOR_STATE_FILE = os.environ.get("NODELOC_SELECTOR_STATE", "/ql/data/scripts/nodeloc_selectors.json").strip()
+
+# 当日进度检查点: 每处理完一个主题写一次, 中断后再次运行从断点继续, 留空关闭
+STATE_FILE = os.environ.get("NODELOC_STATE_FILE", "/ql/data/scripts/nodeloc_state.json").strip()
 
 # 通知配置
 GOTIFY_URL = os.environ.get("GOTIFY_URL")  # Gotify 服务器地址
 GOTIFY_TOKEN = os.environ.get("GOTIFY_TOKEN")  # Gotify Token
 SC3_PUSH_KEY = os.environ.get("SC3_PUSH_KEY")  # Server酱³ SendKey
+# Server酱³ 推送地址模板 ({uid} / {key} 会被替换)
+SC3_API_URL = os.environ.get("SC3_API_URL") or "https://{uid}.push.ft07.com/send/{key}"
+TG_API_BASE = (os.environ.get("TG_API_BASE") or "https://api.telegram.org").rstrip("/")  # Telegram Bot API 地址
 WECHAT_API_URL = os.environ.get("WECHAT_API_URL")   # 自定义微信地址+wxsend API 地址 https://wx.djcf.pp.ua/wxsend
 WECHAT_AUTH_TOKEN = os.environ.get("WECHAT_AUTH_TOKEN") # 自定义微信 Token(可参考饭奇俊微信视频CF搭一个)
+NOTIFY_DEADLINE = float(os.environ.get("NODELOC_NOTIFY_DEADLINE") or 20)  # 所有通知渠道的总超时(秒)
+# 通知发件箱: 未送达的通知持久化, 按指数退避重试, 下次运行开始时后台补发
+NOTIFY_OUTBOX_FILE = os.environ.get("NODELOC_NOTIFY_OUTBOX") or "/ql/data/scripts/nodeloc_notify_outbox.json"
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NODELOC_NOTIFY_MAX_ATTEMPTS") or 5)
+NOTIFY_RETRY_BASE = 60  # 重试退避基数(秒), 第 n 次失败后等待 60 * 2^(n-1) 秒
 
 # 代理配置 (优先读取 NODELOC_PROXY，其次尝试 LINUXDO_PROXY 或 HTTP_PROXY)
 NODELOC_PROXY = os.environ.get("NODELOC_PROXY") or os.environ.get("LINUXDO_PROXY") or os.environ.get("HTTP_PROXY")
@@ -48,6 +99,95 @@ if NODELOC_PROXY:
     logger.info(f"已启用代理配置: {NODELOC_PROXY}")
     logger.info("已设置 NO_PROXY 环境变量以保护本地 WebDriver 连接")
 
+# 常驻浏览器: 设置远程调试地址 (如 127.0.0.1:9222) 后连接已运行的无头 Chromium, 未运行则启动并保持常驻
+CHROME_DEBUG_ADDRESS = os.environ.get("NODELOC_CHROME_DEBUG_ADDRESS", "").strip()
+CHROME_PROFILE_DIR = os.environ.get("NODELOC_CHROME_PROFILE") or "/ql/data/scripts/nodeloc_chrome_profile"
+
+# 元素定位方式, 与 selenium By.CSS_SELECTOR 取值相同 (直接用字符串, CDP 后端无需安装 Selenium)
+BY_CSS = "css selector"
+
+# 浏览器后端: selenium (默认, 经 chromedriver) / cdp (直连 Chromium DevTools 协议, 不需要 chromedriver)
+BROWSER_BACKEND = (os.environ.get("NODELOC_BROWSER_BACKEND") or "selenium").strip().lower()
+
+# 资源屏蔽 (CDP Network.setBlockedURLs): 减少代理流量与渲染开销, NODELOC_BLOCK_RESOURCES=0 关闭
+BLOCK_RESOURCES = os.environ.get("NODELOC_BLOCK_RESOURCES", "1").strip() != "0"
+# 默认屏蔽: 头像、表情、字体、统计/广告脚本
+DEFAULT_BLOCK_PATTERNS = [
+    "*/user_avatar/*",
+    "*/letter_avatar*",
+    "*/images/emoji/*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*hm.baidu.com*",
+    "*clarity.ms*",
+    "*static.cloudflareinsights.com*",
+    "*plausible.io*",
+]
+# 按资源类型屏蔽时使用的 URL 规则
+RESOURCE_TYPE_PATTERNS = {
+    "image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.ico*"],
+    "font": ["*.woff*", "*.ttf*", "*.otf*", "*.eot*"],
+    "media": ["*.mp4*", "*.webm*", "*.mp3*", "*.m4a*", "*.ogg*"],
+}
+# 追加屏蔽规则 / 屏蔽的资源类型 / 要移除的屏蔽规则 (逗号分隔)
+BLOCK_URL_PATTERNS = [p.strip() for p in os.environ.get("NODELOC_BLOCK_URLS", "").split(",") if p.strip()]
+BLOCK_RESOURCE_TYPES = [
+    t.strip().lower() for t in os.environ.get("NODELOC_BLOCK_TYPES", "image,font,media").split(",") if t.strip()
+]
+# setBlockedURLs 只有屏蔽没有放行, 这里按规则原文整条移除 (如 "*/images/emoji/*"), 不是按 URL 放行
+UNBLOCK_RULES = [p.strip() for p in os.environ.get("NODELOC_UNBLOCK_RULES", "").split(",") if p.strip()]
+# 统计被屏蔽的请求数与下载量 (需要浏览器缓存全部网络事件, 默认关闭)
+NET_STATS = os.environ.get("NODELOC_NET_STATS", "0").strip() == "1"
+
+# 阶段耗时: 每次运行以 JSON Lines 追加到 NODELOC_METRICS_FILE (留空关闭),
+# 可选写入 node-exporter textfile collector 目录下的 .prom 文件
+METRICS_FILE = os.environ.get("NODELOC_METRICS_FILE", "/ql/data/scripts/nodeloc_spans.jsonl").strip()
+PROM_TEXTFILE = os.environ.get("NODELOC_PROM_TEXTFILE", "").strip()
+# 运行历史报告 (report 子命令): 对比窗口前同样长度的基线期, p50 变慢超过该倍数且多于 1 秒视为回归
+REPORT_REGRESSION_RATIO = 1.5
+REPORT_MIN_BASELINE_SAMPLES = 3
+# 退出码含义 (写入运行历史)
+EXIT_REASONS = {0: "成功", 1: "未设置账号", 2: "登录失败", 3: "代理不可达", 9: "脚本异常"}
+
+# 低内存模式: 限制渲染进程数、关闭后台服务、限制 JS 堆大小 (适合小内存 ARM 机器)
+LOW_MEMORY = os.environ.get("NODELOC_LOW_MEMORY", "0").strip() == "1"
+JS_HEAP_MB = int(os.environ.get("NODELOC_JS_HEAP_MB") or 256)
+LOW_MEMORY_ARGS = [
+    "--renderer-process-limit=1",
+    "--disable-features=site-per-process,IsolateOrigins,Translate,MediaRouter,OptimizationHints,BackForwardCache",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-breakpad",
+    "--disable-software-rasterizer",
+    "--no-first-run",
+    "--mute-audio",
+    "--aggressive-cache-discard",
+    f"--js-flags=--max-old-space-size={JS_HEAP_MB}",
+]
+# 内存监控采样间隔(秒)
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("NODELOC_MEMORY_SAMPLE_INTERVAL") or 1)
+
+# 运行引擎: browser (默认, 全程使用 Chrome) / http (主题列表与签到走 API, 仅浏览/点赞/回复时启动 Chrome)
+NODELOC_ENGINE = (os.environ.get("NODELOC_ENGINE") or "browser").strip().lower()
+
+# 运行时限(秒): 整次运行的总时长上限 (0 不限制), 截止前预留发送通知与关闭浏览器的时间
+RUN_DEADLINE = float(os.environ.get("NODELOC_RUN_DEADLINE") or 2700)
+QUIT_RESERVE = 15
+# 各阶段的时间上限(秒), 同时受整次运行剩余时间约束; 主题处理使用剩余的全部时间
+PHASE_BUDGETS = {"login": 60, "start_browser": 90, "checkin": 150}
+TOPIC_ESTIMATE = 45  # 还没有完成任何主题时的单主题耗时估计(秒)
+
+# 常驻模式 (daemon 子命令): 内部时间表、状态文件、本地健康检查端口 (0 关闭)、是否在两次运行之间保留浏览器
+SCHEDULE = os.environ.get("NODELOC_SCHEDULE") or "09:00,21:00"
+STATUS_FILE = os.environ.get("NODELOC_STATUS_FILE", "/ql/data/scripts/nodeloc_status.json").strip()
+STATUS_PORT = int(os.environ.get("NODELOC_STATUS_PORT") or 0)
+DAEMON_KEEP_BROWSER = os.environ.get("NODELOC_DAEMON_KEEP_BROWSER", "0").strip() == "1"
+
 # ================== 升级配置 ==================
 # 每日任务配置（加速版 - 快速升级）
 DAILY_TASKS = {
@@ -57,6 +197,21 @@ DAILY_TASKS = {
     "replies_to_post": 5,          # 每日回复数（增加到 5）
 }
 
+# 信任等级要求 (Discourse 默认值, 站点调整后同步修改): 每天首次运行时读取 /u/<用户名>/summary.json,
+# 已达标的项目不再安排任务, 全部达标时只签到 (days_visited / likes_received 无法靠脚本加速)
+TRUST_LEVEL_REQUIREMENTS = {
+    1: {"topics_entered": 5, "posts_read_count": 30, "time_read": 10 * 60},
+    2: {
+        "days_visited": 15, "topics_entered": 20, "posts_read_count": 100, "time_read": 60 * 60,
+        "likes_given": 1, "likes_received": 1, "post_count": 3,
+    },
+}
+# 目标信任等级: 达到后只签到 (TL3 按最近 100 天的活跃度考核且可能被降级, 需要保级时设为 4)
+TARGET_TRUST_LEVEL = int(os.environ.get("NODELOC_TARGET_TRUST_LEVEL") or 3)
+# 每浏览一个主题大约带来的已读帖子数与阅读时间(秒), 用于把差额换算成主题数
+POSTS_PER_TOPIC = 5
+READ_SECONDS_PER_TOPIC = 20
+
 # 回复内容池（避免重复）
 REPLY_TEMPLATES = [
     "感谢分享！",
@@ -73,41 +228,1119 @@ REPLY_TEMPLATES = [
 ]
 
 
+# ================== 页面等待 ==================
+# 等待 JS 条件成立: 监听 DOM 变化与 readystatechange, 条件满足立即返回 (单次 WebDriver 往返)
+WAIT_CONDITION_JS = """
+const done = arguments[arguments.length - 1];
+const timeoutMs = arguments[0];
+const check = () => { try { return !!(__CONDITION__); } catch (e) { return false; } };
+if (check()) { done(true); return; }
+let finished = false;
+const finish = (ok) => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    document.removeEventListener('readystatechange', onChange);
+    clearInterval(poll);
+    clearTimeout(timer);
+    done(ok);
+};
+const onChange = () => { if (check()) finish(true); };
+// DOM 变化合并到下一帧再检查 (条件里可能有 getComputedStyle, 逐条检查会在启动期间反复强制样式计算);
+// 不监听属性变化, 仅由样式/属性切换造成的状态变化由定时轮询兜底
+let scheduled = false;
+const onMutation = () => {
+    if (scheduled) return;
+    scheduled = true;
+    requestAnimationFrame(() => { scheduled = false; if (!finished) onChange(); });
+};
+const observer = new MutationObserver(onMutation);
+observer.observe(document.documentElement, {childList: true, subtree: true});
+document.addEventListener('readystatechange', onChange);
+const poll = setInterval(onChange, 250);
+const timer = setTimeout(() => finish(check()), timeoutMs);
+"""
+
+# Discourse SPA 启动完成: 文档加载完毕且启动遮罩已移除/隐藏
+DISCOURSE_READY_JS = (
+    "document.readyState === 'complete' && "
+    "(!document.querySelector('#d-splash') || "
+    "getComputedStyle(document.querySelector('#d-splash')).display === 'none')"
+)
+
+# 站内路由: 在已启动的 Discourse 应用内切换主题 (不重新加载整个应用), 只等待目标主题的帖子流渲染;
+# 页面上没有 Discourse 路由时返回 null, 由调用方改用 driver.get 整页加载. 参数: [超时毫秒, 路径, 主题ID]
+SPA_NAVIGATION = os.environ.get("NODELOC_SPA_NAVIGATION", "1").strip() != "0"
+SPA_ROUTE_JS = """
+const DiscourseURL = (() => {
+    try { return require('discourse/lib/url').default; } catch (e) { return null; }
+})();
+if (!DiscourseURL || !document.querySelector('#main-outlet')) { arguments[arguments.length - 1](null); return; }
+const [, routePath, routeTopicId] = arguments;
+DiscourseURL.routeTo(routePath);
+""" + WAIT_CONDITION_JS.replace(
+    "__CONDITION__",
+    "routeTopicId ? document.querySelector('#topic[data-topic-id=\"' + routeTopicId + '\"] .topic-post')"
+    " : (location.pathname.indexOf(routePath) === 0 && document.querySelector('#topic .topic-post'))",
+)
+
+# 异步脚本超时(秒), 需大于任何一次条件等待的超时
+SCRIPT_TIMEOUT = 90
+# 页面加载超时(秒), 站点或代理不可用时让 driver.get 尽快报错, 而不是挂满默认的 300 秒
+PAGE_LOAD_TIMEOUT = 45
+
+# Chrome 网络错误页 (chrome-error://), 返回错误码, 正常页面返回 null
+NET_ERROR_JS = (
+    "return location.protocol === 'chrome-error:' ? "
+    "((document.querySelector('.error-code') || {}).textContent || 'ERR_FAILED').trim() : null"
+)
+
+# 一次性提取主题列表 (标题/链接/主题ID/帖子数/最后活动时间), 单次 WebDriver 往返
+EXTRACT_TOPICS_JS = """
+const [rowSelectors, titleSelectors, limit] = arguments;
+const parseCount = (text) => {
+    const m = (text || '').trim().match(/([\\d.]+)\\s*([kK万])?/);
+    if (!m) return 0;
+    const unit = m[2] ? (m[2] === '万' ? 10000 : 1000) : 1;
+    return Math.round(parseFloat(m[1]) * unit);
+};
+let rows = [], rowSelector = null, titleSelector = null;
+for (const sel of rowSelectors) {
+    rows = Array.from(document.querySelectorAll(sel));
+    if (rows.length) { rowSelector = sel; break; }
+}
+const topics = [];
+for (const row of rows.slice(0, limit)) {
+    let link = null;
+    for (const sel of titleSelectors) {
+        link = row.querySelector(sel);
+        if (link) { titleSelector = titleSelector || sel; break; }
+    }
+    if (!link) continue;
+    const title = (link.innerText || link.textContent || '').trim();
+    const url = link.href;
+    if (!title || !url) continue;
+    const idMatch = url.match(/\\/t\\/[^/]+\\/(\\d+)/);
+    const posts = row.querySelector('.posts .number, .posts-map .number, .num.posts .number');
+    const activity = row.querySelector('.activity [data-time], .relative-date[data-time]');
+    topics.push({
+        id: Number(row.dataset.topicId || (idMatch && idMatch[1])) || null,
+        title: title,
+        url: url,
+        posts_count: posts ? parseCount(posts.textContent) : 0,
+        bumped_at: activity ? new Date(Number(activity.dataset.time)).toISOString() : null,
+    });
+}
+return {selector: rowSelector, titleSelector: titleSelector, total: rows.length, topics: topics};
+"""
+
+# 一次性筛选未点赞的按钮: 按顺序尝试 [选择器, 已点赞 class 关键字], 返回首个命中组中未点赞的按钮
+FIND_LIKE_BUTTONS_JS = """
+const [groups, limit] = arguments;
+for (const [sel, likedClasses] of groups) {
+    const buttons = Array.from(document.querySelectorAll(sel));
+    if (!buttons.length) continue;
+    const pending = buttons.slice(0, limit).filter((b) => {
+        const cls = (b.getAttribute('class') || '').toLowerCase();
+        return !likedClasses.some((c) => cls.includes(c));
+    });
+    return {selector: sel, total: buttons.length, buttons: pending};
+}
+return {selector: null, total: 0, buttons: []};
+"""
+
+# 按顺序查找第一个能命中的选择器, 返回 [选择器, 元素], 一次往返代替逐个 find_elements
+FIRST_MATCH_JS = """
+for (const sel of arguments[0]) {
+    const el = document.querySelector(sel);
+    if (el) return [sel, el];
+}
+return [null, null];
+"""
+
+
 # ================== 装饰器 ==================
-def retry_decorator(retries=3, delay=1):
-    """重试装饰器"""
+# 错误分类: 按异常类名 (含父类) 与错误信息判断, 不需要导入 Selenium / curl_cffi 的异常类
+PERMANENT_ERROR_TYPES = {
+    "InvalidSessionIdException", "NoSuchWindowException", "SessionNotCreatedException",
+    "InvalidArgumentException", "NoSuchDriverException", "JavascriptException",
+}
+TRANSIENT_ERROR_TYPES = {
+    "TimeoutException", "TimeoutError", "ConnectionError", "ConnectionResetError",
+    "ConnectionRefusedError", "ConnectionAbortedError", "Timeout", "ReadTimeout", "ConnectTimeout",
+    "ProxyError", "MaxRetryError", "ProtocolError", "RemoteDisconnected",
+}
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r"net::ERR_|ERR_(PROXY|TUNNEL|CONNECTION|NAME_NOT_RESOLVED|TIMED_OUT|INTERNET_DISCONNECTED)"
+    r"|timed? ?out|connection (reset|refused|aborted|closed)|temporarily unavailable"
+    r"|curl: \((5|6|7|28|35|52|55|56)\)|HTTP 5\d\d",
+    re.IGNORECASE,
+)
+
+# 断路器: 连续出现该次数的网络故障后中止剩余主题
+BREAKER_THRESHOLD = int(os.environ.get("NODELOC_BREAKER_THRESHOLD") or 3)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """网络/超时类错误可以重试, 其余 (会话失效、参数错误、元素不存在等) 重试也无济于事"""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & PERMANENT_ERROR_TYPES:
+        return False
+    if names & TRANSIENT_ERROR_TYPES:
+        return True
+    return bool(TRANSIENT_ERROR_PATTERN.search(str(error)))
+
+
+class CircuitBreaker:
+    """连续 threshold 次网络故障后断开; 任意一次成功即复位"""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD):
+        self.threshold = threshold
+        self.failures = 0
+
+    @property
+    def open(self) -> bool:
+        return self.failures >= self.threshold
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self, error: BaseException):
+        if is_transient_error(error):
+            self.failures += 1
+
+
+class RunBudget:
+    """整次运行的时间预算: 截止前预留 reserve 秒给通知与退出, 阶段内再受该阶段上限约束"""
+
+    def __init__(self, total: float = RUN_DEADLINE, reserve: float = NOTIFY_DEADLINE + QUIT_RESERVE):
+        self.deadline = time.time() + total if total > 0 else float("inf")
+        self.reserve = reserve
+        self.phase_deadline = float("inf")
+
+    def remaining(self) -> float:
+        """业务阶段还能使用的秒数 (已扣除预留时间)"""
+        return min(self.deadline - self.reserve, self.phase_deadline) - time.time()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining() <= 0
+
+    def clamp(self, timeout: float, floor: float = 1) -> float:
+        """把等待/请求超时限制在剩余时间内 (至少 floor 秒, 让调用快速失败而不是传入 0)"""
+        return max(floor, min(timeout, self.remaining()))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        previous = self.phase_deadline
+        cap = PHASE_BUDGETS.get(name)
+        if cap:
+            self.phase_deadline = min(previous, time.time() + cap)
+        try:
+            yield
+        finally:
+            self.phase_deadline = previous
+
+
+def retry_decorator(retries=3, delay=1, max_delay=30):
+    """重试装饰器: 仅重试临时错误, 指数退避 (delay * 2^n, 上限 max_delay) 并加随机抖动
+
+    装饰方法时若实例带 budget (RunBudget), 剩余运行时间不够退避等待时不再重试
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            budget = getattr(args[0], "budget", None) if args else None
             for attempt in range(retries):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
+                    if not is_transient_error(e):
+                        logger.error(f"函数 {func.__name__} 执行失败(不可重试): {str(e)}")
+                        raise
                     if attempt == retries - 1:
                         logger.error(f"函数 {func.__name__} 最终执行失败: {str(e)}")
                         raise
-                    logger.warning(f"函数 {func.__name__} 第 {attempt + 1}/{retries} 次尝试失败: {str(e)}")
-                    time.sleep(delay)
+                    backoff = min(max_delay, delay * 2 ** attempt)
+                    backoff = backoff / 2 + random.uniform(0, backoff / 2)
+                    if budget is not None and budget.remaining() <= backoff:
+                        logger.error(f"函数 {func.__name__} 执行失败且剩余运行时间不足,不再重试: {str(e)}")
+                        raise
+                    logger.warning(
+                        f"函数 {func.__name__} 第 {attempt + 1}/{retries} 次尝试失败: {str(e)}, "
+                        f"{backoff:.1f}秒后重试"
+                    )
+                    time.sleep(backoff)
             return None
         return wrapper
     return decorator
 
 
+def timed_span(phase: str):
+    """阶段计时装饰器: 记录方法耗时到 self.spans (返回 False 或抛出异常视为失败)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            span = {"phase": phase, "start": time.time(), "ok": False}
+            if args and isinstance(args[0], dict) and args[0].get("id"):
+                span["topic_id"] = args[0]["id"]
+            try:
+                result = func(self, *args, **kwargs)
+                span["ok"] = result is not False
+                return result
+            except Exception as e:
+                span["error"] = f"{type(e).__name__}: {e}"[:200]
+                raise
+            finally:
+                span["duration"] = round(time.time() - span["start"], 3)
+                self.spans.append(span)
+        return wrapper
+    return decorator
+
+
 # ================== 通知函数 ==================
-def tg_notify(text: str):
+async def _notify_telegram(session, title: str, text: str):
     """TG 推送"""
     token = os.environ.get("TG_BOT_TOKEN", "").strip()
     chat_id = os.environ.get("TG_CHAT_ID", "").strip()
-    if not token or not chat_id:
-        return
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = f"{TG_API_BASE}/bot{token}/sendMessage"
     payload = {"chat_id": chat_id, "text": text, "disable_web_page_preview": True}
+    r = await session.post(url, json=payload)
+    if r.status_code != 200:
+        raise RuntimeError(f"HTTP={r.status_code}")
+
+
+async def _notify_gotify(session, title: str, text: str):
+    """Gotify 推送"""
+    r = await session.post(
+        f"{GOTIFY_URL}/message",
+        params={"token": GOTIFY_TOKEN},
+        json={"title": title, "message": text, "priority": 5},
+    )
+    r.raise_for_status()
+
+
+async def _notify_serverchan(session, title: str, text: str):
+    """Server酱³ 推送"""
+    match = re.match(r"sct(\d+)t", SC3_PUSH_KEY, re.I)
+    if not match:
+        raise ValueError("SC3_PUSH_KEY 格式错误")
+    url = SC3_API_URL.format(uid=match.group(1), key=SC3_PUSH_KEY)
+    r = await session.get(url, params={"title": title, "desp": text})
+    r.raise_for_status()
+
+
+async def _notify_wechat(session, title: str, text: str):
+    """自定义微信 API 推送"""
+    # 优先尝试 GET 请求 (参考 wxpush 常见用法)
+    params = {"token": WECHAT_AUTH_TOKEN, "title": title, "content": text}
+    r = await session.get(WECHAT_API_URL, params=params)
+
+    # 如果 GET 失败 (405 Method Not Allowed), 尝试 POST
+    if r.status_code == 405:
+        logger.debug("自定义微信 GET 返回 405, 尝试 POST")
+        r = await session.post(WECHAT_API_URL, json=params)
+
+    if r.status_code >= 400:
+        raise RuntimeError(f"HTTP {r.status_code}: {r.text[:100]}")
+
+
+# 通知渠道: 名称 -> (是否已配置, 发送协程, 日志名)
+NOTIFY_CHANNELS = {
+    "telegram": (
+        lambda: bool(os.environ.get("TG_BOT_TOKEN", "").strip() and os.environ.get("TG_CHAT_ID", "").strip()),
+        _notify_telegram,
+        "TG",
+    ),
+    "gotify": (lambda: bool(GOTIFY_URL and GOTIFY_TOKEN), _notify_gotify, "Gotify"),
+    "serverchan": (lambda: bool(SC3_PUSH_KEY), _notify_serverchan, "Server 酱³"),
+    "wechat": (lambda: bool(WECHAT_API_URL and WECHAT_AUTH_TOKEN), _notify_wechat, "自定义微信"),
+}
+
+
+async def _dispatch_notifications(items: list, deadline: float) -> dict:
+    """共用一个连接池并发推送, 整体受 deadline 约束, 返回 {通知 id: 是否成功}"""
+    results = {}
+    async with AsyncSession(impersonate="chrome136", timeout=min(15, deadline)) as session:
+        tasks = {
+            asyncio.ensure_future(NOTIFY_CHANNELS[item["channel"]][1](session, item["title"], item["text"])): item
+            for item in items
+        }
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+
+        for task in pending:
+            task.cancel()
+            item = tasks[task]
+            results[item["id"]] = False
+            logger.warning(f"⚠️ {NOTIFY_CHANNELS[item['channel']][2]} 通知超时({deadline:.0f}秒)")
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        for task in done:
+            item = tasks[task]
+            label = NOTIFY_CHANNELS[item["channel"]][2]
+            if task.exception():
+                results[item["id"]] = False
+                logger.warning(f"⚠️ {label} 通知发送失败: {task.exception()}")
+            else:
+                results[item["id"]] = True
+                logger.success(f"✅ {label} 通知发送成功")
+    return results
+
+
+# ================== 通知发件箱 ==================
+_outbox_lock = threading.Lock()
+_outbox_inflight = set()
+
+
+def _load_outbox() -> list:
     try:
-        r = requests.post(url, json=payload, timeout=15, impersonate="chrome136")
-        if r.status_code != 200:
-            logger.warning(f"TG 推送失败 HTTP={r.status_code}")
+        with open(NOTIFY_OUTBOX_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.warning(f"读取通知发件箱失败:{e}")
+        return []
+
+
+def _save_outbox(items: list):
+    try:
+        tmp = f"{NOTIFY_OUTBOX_FILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp, NOTIFY_OUTBOX_FILE)
+    except Exception as e:
+        logger.warning(f"保存通知发件箱失败:{e}")
+
+
+def _new_notifications(title: str, text: str, channels: list) -> list:
+    now = time.time()
+    return [
+        {
+            "id": f"{time.time_ns()}-{channel}",
+            "channel": channel,
+            "title": title,
+            "text": text,
+            "attempts": 0,
+            "created_at": now,
+            "next_at": now,
+        }
+        for channel in channels
+    ]
+
+
+def _deliver(items: list, deadline: float) -> dict:
+    try:
+        return asyncio.run(_dispatch_notifications(items, deadline))
     except Exception as e:
-        logger.warning(f"TG 推送异常:{e}")
+        logger.warning(f"通知推送异常:{e}")
+        return {item["id"]: False for item in items}
+
+
+def _schedule_retry(item: dict) -> bool:
+    """记录一次失败并计算下次重试时间, 不再重试时返回 False"""
+    # 渠道配置已移除的通知直接丢弃
+    if not NOTIFY_CHANNELS[item["channel"]][0]():
+        return False
+    item["attempts"] += 1
+    if item["attempts"] >= NOTIFY_MAX_ATTEMPTS:
+        logger.warning(f"⚠️ {NOTIFY_CHANNELS[item['channel']][2]} 通知重试 {item['attempts']} 次仍失败,已丢弃")
+        return False
+    backoff = NOTIFY_RETRY_BASE * 2 ** (item["attempts"] - 1)
+    item["next_at"] = time.time() + backoff * random.uniform(0.8, 1.2)
+    return True
+
+
+def flush_outbox(deadline: float = NOTIFY_DEADLINE) -> dict:
+    """补发发件箱中已到重试时间的通知, 返回 {通知 id: 是否成功}"""
+    now = time.time()
+    with _outbox_lock:
+        due = [
+            item for item in _load_outbox()
+            if item["id"] not in _outbox_inflight
+            and item["next_at"] <= now
+            and item["channel"] in NOTIFY_CHANNELS
+        ]
+        _outbox_inflight.update(item["id"] for item in due)
+    if not due:
+        return {}
+
+    results = _deliver(due, deadline)
+
+    with _outbox_lock:
+        _outbox_inflight.difference_update(item["id"] for item in due)
+        remaining = []
+        for item in _load_outbox():
+            if item["id"] not in results:
+                remaining.append(item)
+            elif not results[item["id"]] and _schedule_retry(item):
+                remaining.append(item)
+        _save_outbox(remaining)
+    return results
+
+
+def flush_outbox_in_background() -> threading.Thread:
+    """后台补发上次运行遗留的通知, 不阻塞主流程"""
+    thread = threading.Thread(target=flush_outbox, name="notify-outbox", daemon=True)
+    thread.start()
+    return thread
+
+
+def notify(text: str, title: str = "NodeLoc 升级任务", channels: list = None, deadline: float = NOTIFY_DEADLINE) -> dict:
+    """立即并发推送到已配置的通知渠道, 只把发送失败的写入发件箱等待重试, 返回 {渠道: 是否成功}
+
+    发件箱不可写时通知照常发送, 只是失败的不会被补发
+    """
+    names = [
+        name for name in (channels or NOTIFY_CHANNELS)
+        if name in NOTIFY_CHANNELS and NOTIFY_CHANNELS[name][0]()
+    ]
+    if not names:
+        return {}
+    items = _new_notifications(title, text, names)
+    results = _deliver(items, deadline)
+    failed = [item for item in items if not results.get(item["id"]) and _schedule_retry(item)]
+    if failed:
+        with _outbox_lock:
+            _save_outbox(_load_outbox() + failed)
+    return {item["channel"]: bool(results.get(item["id"])) for item in items}
+
+
+def tg_notify(text: str):
+    """TG 推送"""
+    notify(text, channels=["telegram"])
+
+
+# ================== 内存监控 ==================
+def _cgroup_memory_limit_kb() -> int:
+    """读取容器内存上限 (cgroup v2/v1), 未限制时返回 0"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path, "r") as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // 1024
+        return 0
+    return 0
+
+
+class MemoryWatchdog:
+    """后台采样 chromedriver + Chromium 进程树的 RSS 总和, 记录峰值 (读取 /proc, 仅 Linux)"""
+
+    def __init__(self, root_pids_fn, interval: float = MEMORY_SAMPLE_INTERVAL):
+        self.root_pids_fn = root_pids_fn
+        self.interval = interval
+        self.peak_kb = 0
+        self.peak_processes = 0
+        self.limit_kb = _cgroup_memory_limit_kb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _process_table() -> dict:
+        """返回 {pid: (ppid, cmdline)}"""
+        table = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat", "r") as f:
+                    # comm 字段可能包含空格, 从最后一个 ')' 之后解析
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ").decode("utf-8", "ignore")
+            except (OSError, IndexError, ValueError):
+                continue
+            table[int(name)] = (ppid, cmdline)
+        return table
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/statm", "r") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def sample(self) -> int:
+        """采样一次进程树 RSS 总和(KB)"""
+        roots = set(self.root_pids_fn())
+        if not (roots or CHROME_DEBUG_ADDRESS) or not os.path.isdir("/proc"):
+            return 0
+        table = self._process_table()
+        if CHROME_DEBUG_ADDRESS:
+            # 常驻 Chromium 不是本进程的子进程 (CDP 后端连接时也没有 chromedriver), 按专用 profile 目录识别
+            roots.update(pid for pid, (_, cmd) in table.items() if f"--user-data-dir={CHROME_PROFILE_DIR}" in cmd)
+        if not roots:
+            return 0
+
+        children = {}
+        for pid, (ppid, _) in table.items():
+            children.setdefault(ppid, []).append(pid)
+        tree, stack = set(), [pid for pid in roots if pid in table]
+        while stack:
+            pid = stack.pop()
+            if pid in tree:
+                continue
+            tree.add(pid)
+            stack.extend(children.get(pid, []))
+
+        total = sum(self._rss_kb(pid) for pid in tree)
+        if total > self.peak_kb:
+            self.peak_kb = total
+            self.peak_processes = len(tree)
+        return total
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug(f"内存采样失败:{e}")
+
+    def start(self):
+        if not os.path.isdir("/proc") or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-watchdog", daemon=True)
+        self._thread.start()
+
+    def reset(self):
+        """清零峰值 (常驻模式下每次运行单独统计)"""
+        self.peak_kb = 0
+        self.peak_processes = 0
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def summary(self) -> str:
+        if not self.peak_kb:
+            return ""
+        text = f"Chrome 峰值内存: {self.peak_kb / 1024:.0f} MB ({self.peak_processes} 个进程)"
+        if self.limit_kb:
+            text += f", 容器上限 {self.limit_kb / 1024:.0f} MB ({self.peak_kb * 100 / self.limit_kb:.0f}%)"
+        return text
+
+
+# ================== CDP 直连驱动 ==================
+# 把参数/返回值中的 DOM 节点登记到页面内的表里, 以 {"__node__": 序号} 往返, 一次 Runtime.evaluate 完成调用
+CDP_CALL_JS = """
+(function (args, fn, isAsync) {
+    const reg = window.__nodelocNodes || (window.__nodelocNodes = []);
+    const revive = (v) => {
+        if (Array.isArray(v)) return v.map(revive);
+        if (v && typeof v === 'object') {
+            if ('__node__' in v) return reg[v.__node__];
+            const o = {};
+            for (const k of Object.keys(v)) o[k] = revive(v[k]);
+            return o;
+        }
+        return v;
+    };
+    const pack = (v) => {
+        if (v instanceof Node) {
+            let i = reg.indexOf(v);
+            if (i < 0) i = reg.push(v) - 1;
+            return {__node__: i};
+        }
+        if (Array.isArray(v) || v instanceof NodeList || v instanceof HTMLCollection) return Array.from(v, pack);
+        if (v && typeof v === 'object') {
+            const o = {};
+            for (const k of Object.keys(v)) o[k] = pack(v[k]);
+            return o;
+        }
+        return v === undefined ? null : v;
+    };
+    const real = revive(args);
+    if (!isAsync) return pack(fn.apply(window, real));
+    return new Promise((resolve) => fn.apply(window, real.concat([(v) => resolve(pack(v))])));
+})
+"""
+
+
+class CDPError(RuntimeError):
+    pass
+
+
+class CDPTimeout(CDPError, TimeoutError):
+    pass
+
+
+class JavascriptException(CDPError):
+    """与 Selenium 同名, 便于 is_transient_error 按类名归为不可重试"""
+
+
+class NoSuchElementException(CDPError):
+    pass
+
+
+class CDPElement:
+    """页面元素句柄 (对应页面内节点表的序号, 导航后失效)"""
+
+    def __init__(self, driver, node: int):
+        self.driver = driver
+        self.node = node
+
+    def click(self):
+        self.driver.execute_script("arguments[0].click();", self)
+
+    def get_attribute(self, name: str):
+        return self.driver.execute_script("return arguments[0].getAttribute(arguments[1]);", self, name)
+
+    def clear(self):
+        self.driver.execute_script(
+            "arguments[0].value = ''; arguments[0].dispatchEvent(new Event('input', {bubbles: true}));", self
+        )
+
+    def send_keys(self, text: str):
+        self.driver.execute_script("arguments[0].focus();", self)
+        self.driver.execute("Input.insertText", {"text": text})
+
+
+class CDPDriver:
+    """
+    直连 Chromium DevTools 协议的精简驱动 (不经过 chromedriver), 提供脚本中用到的 WebDriver 接口子集:
+    get / execute_script / execute_async_script / find_elements / add_cookie / execute_cdp_cmd /
+    get_log("performance") / page_source / get_screenshot_as_png / close / quit
+    """
+
+    def __init__(self, address: str, process=None, profile_dir: str = None):
+        self.address = address
+        self.process = process
+        self.profile_dir = profile_dir
+        self.script_timeout = SCRIPT_TIMEOUT
+        self.page_load_timeout = PAGE_LOAD_TIMEOUT
+        self._next_id = 0
+        self._events = []
+        self._performance_log = []
+
+        self.http = requests.Session()
+        target = self.http.put(f"http://{address}/json/new?about:blank", timeout=10).json()
+        self.target_id = target["id"]
+        self.ws = self.http.ws_connect(target["webSocketDebuggerUrl"])
+        self.execute("Page.enable")
+        self.execute("Runtime.enable")
+
+    @classmethod
+    def launch(cls, chrome_path: str, chrome_args: list):
+        """启动独立的 Chromium (临时 profile, 随机调试端口)"""
+        profile_dir = tempfile.mkdtemp(prefix="nodeloc-cdp-")
+        cmd = [
+            chrome_path,
+            *chrome_args,
+            "--remote-debugging-port=0",
+            "--remote-allow-origins=*",
+            f"--user-data-dir={profile_dir}",
+            "about:blank",
+        ]
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # Chromium 就绪后会把实际端口写入 profile 下的 DevToolsActivePort
+        port_file = os.path.join(profile_dir, "DevToolsActivePort")
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                with open(port_file, "r", encoding="utf-8") as f:
+                    port = f.readline().strip()
+                if port:
+                    return cls(f"127.0.0.1:{port}", process=process, profile_dir=profile_dir)
+            except FileNotFoundError:
+                pass
+            time.sleep(0.1)
+
+        process.kill()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        raise RuntimeError("Chromium 启动失败或未开启调试端口")
+
+    @classmethod
+    def attach(cls, address: str):
+        """连接常驻 Chromium: 关闭上次残留的标签页 (保留一个避免浏览器退出), 再新开一个标签页"""
+        http = requests.Session()
+        pages = [t for t in http.get(f"http://{address}/json/list", timeout=5).json() if t.get("type") == "page"]
+        for target in pages[1:]:
+            try:
+                http.get(f"http://{address}/json/close/{target['id']}", timeout=5)
+            except Exception:
+                pass
+        return cls(address)
+
+    # ---------------- 协议 ----------------
+    def _recv(self, deadline: float) -> dict:
+        chunks = []
+        while True:
+            try:
+                chunk, frame = self.ws.recv_fragment()
+            except CurlError as e:
+                if e.code != CurlECode.AGAIN:
+                    raise
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise CDPTimeout("等待 DevTools 响应超时")
+                select.select([self.ws.curl.getinfo(CurlInfo.ACTIVESOCKET)], [], [], min(remaining, 0.5))
+                continue
+            if frame.flags & (CurlWsFlag.PING | CurlWsFlag.PONG):
+                continue
+            chunks.append(chunk)
+            if frame.bytesleft == 0 and not frame.flags & CurlWsFlag.CONT:
+                return json.loads(b"".join(chunks))
+
+    def _dispatch(self, message: dict):
+        method = message.get("method")
+        if NET_STATS and method in ("Network.loadingFailed", "Network.loadingFinished"):
+            # 与 chromedriver 性能日志格式一致, 供 _collect_network_stats 复用
+            self._performance_log.append({"message": json.dumps({"message": message})})
+        elif method == "Page.loadEventFired":
+            self._events.append(method)
+
+    def execute(self, method: str, params: dict = None, timeout: float = 30) -> dict:
+        """发送一条 CDP 命令并等待对应响应, 期间收到的事件按需缓存"""
+        self._next_id += 1
+        command_id = self._next_id
+        self.ws.send_str(json.dumps({"id": command_id, "method": method, "params": params or {}}))
+        deadline = time.time() + timeout
+        while True:
+            message = self._recv(deadline)
+            if message.get("id") == command_id:
+                if "error" in message:
+                    raise CDPError(f"{method}: {message['error'].get('message')}")
+                return message.get("result") or {}
+            if "method" in message:
+                self._dispatch(message)
+
+    def _wait_event(self, method: str, timeout: float) -> bool:
+        deadline = time.time() + timeout
+        while method not in self._events:
+            try:
+                self._dispatch(self._recv(deadline))
+            except CDPTimeout:
+                return False
+        self._events.remove(method)
+        return True
+
+    # ---------------- WebDriver 兼容接口 ----------------
+    def set_script_timeout(self, seconds: float):
+        self.script_timeout = seconds
+
+    def set_page_load_timeout(self, seconds: float):
+        self.page_load_timeout = seconds
+
+    def get(self, url: str):
+        self._events.clear()
+        result = self.execute("Page.navigate", {"url": url})
+        if result.get("errorText"):
+            raise ConnectionError(result["errorText"])
+        if not self._wait_event("Page.loadEventFired", self.page_load_timeout):
+            raise CDPTimeout(f"页面加载超时:{url}")
+
+    def _pack(self, value):
+        if isinstance(value, CDPElement):
+            return {"__node__": value.node}
+        if isinstance(value, (list, tuple)):
+            return [self._pack(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._pack(v) for k, v in value.items()}
+        return value
+
+    def _unpack(self, value):
+        if isinstance(value, list):
+            return [self._unpack(v) for v in value]
+        if isinstance(value, dict):
+            if "__node__" in value:
+                return CDPElement(self, value["__node__"])
+            return {k: self._unpack(v) for k, v in value.items()}
+        return value
+
+    def _call(self, script: str, args: tuple, is_async: bool):
+        expression = (
+            f"{CDP_CALL_JS}({json.dumps(self._pack(list(args)))}, "
+            f"function () {{\n{script}\n}}, {'true' if is_async else 'false'})"
+        )
+        timeout = self.script_timeout if is_async else 30
+        result = self.execute(
+            "Runtime.evaluate",
+            {"expression": expression, "returnByValue": True, "awaitPromise": True},
+            timeout=timeout + 5,
+        )
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise JavascriptException((details.get("exception") or {}).get("description") or details.get("text"))
+        return self._unpack((result.get("result") or {}).get("value"))
+
+    def execute_script(self, script: str, *args):
+        return self._call(script, args, is_async=False)
+
+    def execute_async_script(self, script: str, *args):
+        return self._call(script, args, is_async=True)
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: dict):
+        return self.execute(cmd, cmd_args)
+
+    def find_elements(self, by: str, value: str) -> list:
+        """只支持 CSS 选择器 (by 参数为兼容 Selenium 签名保留)"""
+        return self.execute_script("return document.querySelectorAll(arguments[0]);", value) or []
+
+    def find_element(self, by: str, value: str) -> CDPElement:
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"未找到元素:{value}")
+        return elements[0]
+
+    def add_cookie(self, cookie: dict):
+        params = {k: v for k, v in cookie.items() if k in ("name", "value", "domain", "path", "secure", "httpOnly")}
+        if cookie.get("expiry"):
+            params["expires"] = cookie["expiry"]
+        self.execute("Network.setCookie", params)
+
+    def get_log(self, log_type: str) -> list:
+        if log_type != "performance":
+            return []
+        entries, self._performance_log = self._performance_log, []
+        return entries
+
+    @property
+    def page_source(self) -> str:
+        return self.execute_script("return document.documentElement.outerHTML;")
+
+    def get_screenshot_as_png(self) -> bytes:
+        return base64.b64decode(self.execute("Page.captureScreenshot", {"format": "png"})["data"])
+
+    def close(self):
+        """关闭本驱动打开的标签页"""
+        try:
+            self.http.get(f"http://{self.address}/json/close/{self.target_id}", timeout=5)
+        except Exception:
+            pass
+
+    def quit(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+# ================== 主题缓存 ==================
+class TopicCache:
+    """本地主题缓存: 主题 id -> 标题/链接/最后活动时间/最后访问时间, 以及列表拉取游标"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS topics (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                posts_count INTEGER DEFAULT 0,
+                bumped_at TEXT,
+                last_seen REAL,
+                last_visit REAL,
+                visited_bumped_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self.conn.execute(
+            "DELETE FROM topics WHERE last_seen < ?", (time.time() - TOPIC_CACHE_KEEP_DAYS * 86400,)
+        )
+        self.conn.commit()
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def upsert(self, topics: list) -> int:
+        """写入主题列表, 返回新增或有新动态的主题数"""
+        changed = 0
+        now = time.time()
+        for t in topics:
+            if not t.get("id"):
+                continue
+            row = self.conn.execute("SELECT bumped_at FROM topics WHERE id = ?", (t["id"],)).fetchone()
+            if row is None or (t.get("bumped_at") or "") > (row[0] or ""):
+                changed += 1
+            self.conn.execute(
+                """
+                INSERT INTO topics (id, title, url, posts_count, bumped_at, last_seen) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title, url = excluded.url, posts_count = excluded.posts_count,
+                    bumped_at = COALESCE(excluded.bumped_at, topics.bumped_at), last_seen = excluded.last_seen
+                """,
+                (t["id"], t["title"], t["url"], t.get("posts_count") or 0, t.get("bumped_at"), now),
+            )
+        self.conn.commit()
+        return changed
+
+    def fresh_topics(self, limit: int) -> list:
+        """未访问过或访问后有新回复的主题, 按最后活动时间倒序"""
+        rows = self.conn.execute(
+            """
+            SELECT id, title, url, posts_count, bumped_at FROM topics
+            WHERE last_visit IS NULL OR COALESCE(bumped_at, '') > COALESCE(visited_bumped_at, '')
+            ORDER BY bumped_at DESC LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        keys = ("id", "title", "url", "posts_count", "bumped_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def mark_visited(self, topic_id: int):
+        self.conn.execute(
+            "UPDATE topics SET last_visit = ?, visited_bumped_at = bumped_at WHERE id = ?",
+            (time.time(), topic_id),
+        )
+        self.conn.commit()
+
+
+class DebugCapture:
+    """调试快照: 主线程只取数据, 压缩/写盘/按容量轮转都在后台线程完成"""
+
+    # 本类写出的文件名 (轮转只统计和删除这些, 目录里的其他文件一律不动)
+    FILE_PATTERN = re.compile(r"^\d{8}-\d{6}-\d{3}-[\w-]*\.(?:html\.gz|mhtml\.gz|png)$")
+
+    def __init__(self, directory: str, max_mb: float = DEBUG_MAX_MB, mhtml: bool = DEBUG_MHTML):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.mhtml = mhtml
+        self.executor = None
+        self.pending = []
+        if directory:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-capture")
+
+    def capture(self, driver, reason: str):
+        if not self.executor or driver is None:
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        name = re.sub(r"[^\w-]+", "_", reason)[:40]
+        prefix = os.path.join(self.directory, f"{stamp}-{name}")
+
+        artifacts = []
+        if self.mhtml:
+            try:
+                data = driver.execute_cdp_cmd("Page.captureSnapshot", {"format": "mhtml"})["data"]
+                artifacts.append((f"{prefix}.mhtml.gz", data.encode("utf-8"), True))
+            except Exception as e:
+                logger.debug(f"[DEBUG] MHTML 快照失败,改存 HTML:{e}")
+        if not artifacts:
+            try:
+                artifacts.append((f"{prefix}.html.gz", driver.page_source.encode("utf-8", "ignore"), True))
+            except Exception as e:
+                logger.warning(f"[DEBUG] 获取 HTML 失败:{e}")
+        try:
+            # PNG 本身已压缩, 原样写入
+            artifacts.append((f"{prefix}.png", driver.get_screenshot_as_png(), False))
+        except Exception as e:
+            logger.warning(f"[DEBUG] 截图失败:{e}")
+
+        if artifacts:
+            self.pending = [f for f in self.pending if not f.done()]
+            self.pending.append(self.executor.submit(self._write, reason, artifacts))
+
+    def _write(self, reason: str, artifacts: list):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for path, data, compress in artifacts:
+                if compress:
+                    with gzip.open(path, "wb", compresslevel=6) as f:
+                        f.write(data)
+                else:
+                    with open(path, "wb") as f:
+                        f.write(data)
+            logger.warning(f"[DEBUG] {reason}:已保存 {len(artifacts)} 个调试文件 -> {self.directory}")
+            self._rotate()
+        except Exception as e:
+            logger.warning(f"[DEBUG] 保存调试文件失败:{e}")
+
+    def _rotate(self):
+        """调试文件总大小超过上限时从最旧的开始删除"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if self.FILE_PATTERN.match(name) and os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def flush(self, timeout: float = 30):
+        """等待未完成的写入 (每次运行结束时调用)"""
+        if self.pending:
+            wait(self.pending, timeout=timeout)
+            self.pending = []
+
+
+class SelectorResolver:
+    """按元素类别记录命中的选择器: 上次命中的排在最前, 命中结果变化时提示页面结构可能已调整"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.winners = {}
+        self.dirty = False
+        if not path:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.winners = json.load(f) or {}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取选择器排名失败:{e}")
+
+    def order(self, key: str, candidates: list) -> list:
+        """返回候选选择器, 上次命中的排在最前"""
+        winner = (self.winners.get(key) or {}).get("selector")
+        if winner in candidates:
+            return [winner] + [c for c in candidates if c != winner]
+        return list(candidates)
+
+    def record(self, key: str, selector: str):
+        if not selector:
+            return
+        entry = self.winners.get(key) or {}
+        previous = entry.get("selector")
+        if previous and previous != selector:
+            logger.warning(f"页面结构可能有变化: {key} 的选择器由 '{previous}' 变为 '{selector}'")
+        self.winners[key] = {
+            "selector": selector,
+            "hits": (entry.get("hits", 0) if previous == selector else 0) + 1,
+            "last_hit": time.time(),
+        }
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.winners, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except Exception as e:
+            logger.warning(f"保存选择器排名失败:{e}")
 
 
 class NodeLocUpgrade:
@@ -131,40 +1364,252 @@ class NodeLocUpgrade:
             }
 
         self.driver = None
+        self.page_load_timeout = None
+        self.csrf_token = None
+        self.current_user = None
+        self.session_expires_at = None  # 会话缓存的强制重新登录时间, 刷新 Cookie 时沿用
+        self.warm_browser = bool(CHROME_DEBUG_ADDRESS)
+        self.keep_browser = False  # 常驻模式下运行结束不关闭浏览器, 供下次运行复用
+        self.budget = RunBudget()
+        self.net_stats = {"blocked": 0, "blocked_by_type": {}, "bytes_loaded": 0}
+        self.spans = []
+        self.memory_watchdog = MemoryWatchdog(self._browser_root_pids)
+        self.topic_cache = None
+        if TOPIC_CACHE_DB:
+            try:
+                self.topic_cache = TopicCache(TOPIC_CACHE_DB)
+            except Exception as e:
+                logger.warning(f"打开主题缓存失败,不使用缓存:{e}")
         self.stats = {
             'topics_browsed': 0,
             'posts_read': 0,
             'likes_given': 0,
             'replies_posted': 0,
         }
+        self.tasks = dict(DAILY_TASKS)
+        self.checkpoint = self._new_checkpoint()
+        self.selectors = SelectorResolver(SELECTOR_STATE_FILE)
+        self.debug_capture = DebugCapture(DEBUG_DIR)
+
+    # ---------------- Checkpoint ----------------
+    def _new_checkpoint(self) -> dict:
+        return {
+            "date": time.strftime("%Y-%m-%d"),
+            "username": self.username,
+            "checkin_done": False,
+            "processed": [],
+            "stats": {},
+            "totals": {},  # 今日已完成的运行累计的统计 (不含正在续跑的 stats)
+            "progress": None,  # 当日首次查询的信任等级进度
+            "completed": False,
+        }
+
+    def _load_checkpoint(self):
+        """读取今日检查点: 已签到/已处理主题始终沿用, 仅上次未跑完时才接着累计统计"""
+        self.checkpoint = self._new_checkpoint()
+        if not STATE_FILE:
+            return
+        try:
+            with open(STATE_FILE, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"读取检查点失败,从头开始:{e}")
+            return
+
+        if state.get("date") != self.checkpoint["date"] or state.get("username") != self.username:
+            return
+
+        self.checkpoint["checkin_done"] = bool(state.get("checkin_done"))
+        self.checkpoint["processed"] = list(state.get("processed") or [])
+        self.checkpoint["progress"] = state.get("progress")
+        totals = dict(state.get("totals") or {})
+        if state.get("completed"):
+            for key, value in (state.get("stats") or {}).items():
+                totals[key] = totals.get(key, 0) + value
+        self.checkpoint["totals"] = totals
+        if not state.get("completed"):
+            for key, value in (state.get("stats") or {}).items():
+                if key in self.stats:
+                    self.stats[key] = value
+            logger.info(
+                f"♻️ 从检查点恢复:已处理 {len(self.checkpoint['processed'])} 个主题,"
+                f"签到{'已' if self.checkpoint['checkin_done'] else '未'}完成"
+            )
+
+    def _save_checkpoint(self, completed: bool = False):
+        """原子写入检查点 (先写临时文件再替换, 中途被杀也不会留下半个文件)"""
+        if not STATE_FILE:
+            return
+        self.checkpoint["stats"] = dict(self.stats)
+        self.checkpoint["completed"] = completed
+        self.checkpoint["updated_at"] = time.time()
+        try:
+            tmp = f"{STATE_FILE}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.checkpoint, f, ensure_ascii=False)
+            os.replace(tmp, STATE_FILE)
+        except Exception as e:
+            logger.warning(f"保存检查点失败:{e}")
+
+    @staticmethod
+    def _topic_key(topic: dict) -> str:
+        return str(topic.get("id") or topic.get("url"))
 
     # ---------------- Debug ----------------
     def _save_debug(self, reason: str):
+        self.debug_capture.capture(self.driver, reason)
+
+    # ---------------- Login (API) ----------------
+    def _fetch_csrf(self, referer: str = LOGIN_URL) -> str:
+        """获取 CSRF Token"""
+        headers = {"X-Requested-With": "XMLHttpRequest", "Referer": referer}
+        r = self.session.get(CSRF_URL, headers=headers, impersonate="chrome136", timeout=self.budget.clamp(15))
+        j = r.json() if r is not None else {}
+        csrf = (j or {}).get("csrf")
+        if not csrf:
+            logger.error(f"NodeLoc:获取 CSRF 失败,返回={str(j)[:300]}")
+        self.csrf_token = csrf
+        return csrf
+
+    def _fetch_current_user(self) -> dict:
+        """读取 /session/current.json 的 current_user (每次运行只请求一次, 签到状态与信任等级共用), 未登录返回 {}"""
+        if self.current_user is not None:
+            return self.current_user
+        headers = {"X-Requested-With": "XMLHttpRequest", "Referer": f"{HOME_URL}/"}
+        try:
+            r = self.session.get(CURRENT_SESSION_URL, headers=headers, impersonate="chrome136",
+                                 timeout=self.budget.clamp(10))
+            if r.status_code != 200:
+                return {}
+            self.current_user = (r.json() or {}).get("current_user") or {}
+        except Exception as e:
+            logger.debug(f"读取当前用户失败:{e}")
+            return {}
+        return self.current_user
+
+    def _check_session(self) -> bool:
+        """用一次轻量请求校验当前 Cookie 是否仍处于登录状态"""
+        return bool(self._fetch_current_user())
+
+    def _load_session_cache(self) -> bool:
+        """加载会话缓存, 校验通过返回 True"""
         try:
-            html = self.driver.page_source
-            with open(DEBUG_HTML, "w", encoding="utf-8", errors="ignore") as f:
-                f.write(html)
-            logger.warning(f"[DEBUG] {reason}:已保存 HTML -> {DEBUG_HTML}")
+            with open(SESSION_CACHE_FILE, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return False
         except Exception as e:
-            logger.warning(f"[DEBUG] 保存 HTML 失败:{e}")
+            logger.warning(f"读取会话缓存失败:{e}")
+            return False
+
+        if cache.get("username") != self.username:
+            return False
+        if cache.get("expires_at", 0) <= time.time():
+            logger.info("会话缓存已过期")
+            return False
+
+        now = time.time()
+        for c in cache.get("cookies", []):
+            if c.get("expires") and c["expires"] <= now:
+                continue
+            self._set_session_cookie(c)
+
+        if self._check_session():
+            # 校验请求可能已轮换 _t, 立即写回
+            self.session_expires_at = cache["expires_at"]
+            self._save_session_cache()
+            return True
+
+        logger.info("会话缓存已失效,重新登录")
+        self.current_user = None
+        self.session.cookies.clear()
+        return False
+
+    @staticmethod
+    def _cookie_http_only(c: Cookie) -> bool:
+        # curl_cffi 解析响应头得到的 Cookie 记为 http_only="True"/"False", Cookies.set() 设置的一律带 HttpOnly
+        if c.has_nonstandard_attr("http_only"):
+            return str(c.get_nonstandard_attr("http_only")).lower() == "true"
+        return c.has_nonstandard_attr("HttpOnly")
 
+    def _set_session_cookie(self, c: dict):
+        """按缓存/浏览器中的属性写入 session (Cookies.set() 会丢失过期时间并强制 HttpOnly)"""
+        domain = c.get("domain") or ""
+        self.session.cookies.jar.set_cookie(Cookie(
+            version=0, name=c["name"], value=c["value"], port=None, port_specified=False,
+            domain=domain, domain_specified=bool(domain), domain_initial_dot=domain.startswith("."),
+            path=c.get("path") or "/", path_specified=True, secure=bool(c.get("secure")),
+            expires=int(c["expires"]) if c.get("expires") else None, discard=not c.get("expires"),
+            comment=None, comment_url=None, rest={"http_only": str(bool(c.get("httpOnly")))},
+        ))
+
+    def _pull_browser_cookies(self):
+        """把浏览器中(可能已被轮换)的站点 Cookie 同步回 session"""
+        if not self.driver:
+            return
         try:
-            self.driver.save_screenshot(DEBUG_PNG)
-            logger.warning(f"[DEBUG] {reason}:已保存截图 -> {DEBUG_PNG}")
+            result = self.driver.execute_cdp_cmd("Network.getAllCookies", {}) or {}
         except Exception as e:
-            logger.warning(f"[DEBUG] 截图失败:{e}")
+            logger.debug(f"读取浏览器 Cookie 失败:{e}")
+            return
+        host = urlparse(HOME_URL).hostname or ""
+        for c in result.get("cookies") or []:
+            domain = c.get("domain") or ""
+            if host == domain.lstrip(".") or host.endswith("." + domain.lstrip(".")):
+                expires = c.get("expires")
+                self._set_session_cookie({**c, "expires": expires if expires and expires > 0 else None})
 
-    # ---------------- Login (API) ----------------
+    def _save_session_cache(self):
+        """保存登录 Cookie 到会话缓存 (登录、缓存校验通过以及每次运行结束时写入, 跟上 _t 的轮换)"""
+        cookies = [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "secure": c.secure,
+                "httpOnly": self._cookie_http_only(c),
+                "expires": c.expires,
+            }
+            for c in self.session.cookies.jar
+        ]
+        if not cookies:
+            return
+        cache = {
+            "username": self.username,
+            "saved_at": time.time(),
+            "expires_at": self.session_expires_at or time.time() + SESSION_CACHE_TTL_HOURS * 3600,
+            "cookies": cookies,
+        }
+        try:
+            tmp = f"{SESSION_CACHE_FILE}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, SESSION_CACHE_FILE)
+            logger.debug(f"已保存会话缓存 -> {SESSION_CACHE_FILE}")
+        except Exception as e:
+            logger.warning(f"保存会话缓存失败:{e}")
+
+    @timed_span("login")
     def login(self) -> bool:
         """API 登录获取 Cookie"""
+        # 常驻模式: 上次运行的 session 仍在内存中, 校验通过即可直接沿用
+        if self.session.cookies.jar and (self.session_expires_at or 0) > time.time() and self._check_session():
+            logger.success("NodeLoc:当前会话仍有效,跳过登录")
+            return True
+        if self._load_session_cache():
+            logger.success("NodeLoc:会话缓存有效,跳过登录")
+            return True
+
+        self.session_expires_at = None
         logger.info("NodeLoc:开始登录(API)")
         headers = {"X-Requested-With": "XMLHttpRequest", "Referer": LOGIN_URL}
 
-        r = self.session.get(CSRF_URL, headers=headers, impersonate="chrome136")
-        j = r.json() if r is not None else {}
-        csrf = (j or {}).get("csrf")
+        csrf = self._fetch_csrf()
         if not csrf:
-            logger.error(f"NodeLoc:获取 CSRF 失败,返回={str(j)[:300]}")
             return False
 
         headers.update(
@@ -176,7 +1621,7 @@ class NodeLocUpgrade:
         )
 
         data = {"login": self.username, "password": self.password, "timezone": "Asia/Shanghai"}
-        r = self.session.post(SESSION_URL, data=data, headers=headers, impersonate="chrome136")
+        r = self.session.post(SESSION_URL, data=data, headers=headers, impersonate="chrome136", timeout=self.budget.clamp(20))
 
         if r.status_code != 200:
             logger.error(f"NodeLoc:登录失败 HTTP={r.status_code}")
@@ -189,30 +1634,60 @@ class NodeLocUpgrade:
             return False
 
         logger.success("NodeLoc:登录成功")
+        self.session_expires_at = time.time() + SESSION_CACHE_TTL_HOURS * 3600
+        self._save_session_cache()
         return True
 
+    # ---------------- Preflight ----------------
+    def _check_proxy(self) -> bool:
+        """检查代理端口是否可达"""
+        if not NODELOC_PROXY:
+            return True
+        parsed = urlparse(NODELOC_PROXY if "://" in NODELOC_PROXY else f"http://{NODELOC_PROXY}")
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 1080), timeout=3):
+                return True
+        except (OSError, ValueError) as e:
+            logger.error(f"NodeLoc:代理不可达 {parsed.hostname}:{parsed.port or 1080} ({e})")
+            return False
+
+    def preflight(self) -> int:
+        """快速预检 (仅使用 curl_cffi): 代理连通性 + 登录, 通过返回 0, 否则返回退出码"""
+        if not self._check_proxy():
+            tg_notify("NodeLoc:代理不可达 ❌")
+            return 3
+
+        if not self.login():
+            logger.error("NodeLoc:登录失败 ❌")
+            tg_notify("NodeLoc:登录失败 ❌")
+            return 2
+        return 0
+
     # ---------------- Browser (Selenium) ----------------
+    @timed_span("start_browser")
     def start_browser(self):
         """启动 Chrome 浏览器"""
         logger.info("NodeLoc:启动 Chrome")
 
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--disable-web-security")
-        options.add_argument("--lang=zh-CN")
-        options.add_argument("--blink-settings=imagesEnabled=false")
-        
+        chrome_args = [
+            "--headless",
+            "--no-sandbox",
+            "--disable-dev-shm-usage",
+            "--disable-gpu",
+            "--disable-blink-features=AutomationControlled",
+            "--disable-web-security",
+            "--lang=zh-CN",
+            "--blink-settings=imagesEnabled=false",
+        ]
+
         # 配置浏览器代理
         if NODELOC_PROXY:
-            options.add_argument(f"--proxy-server={NODELOC_PROXY}")
-        
-        options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        options.add_experimental_option("useAutomationExtension", False)
-        
+            chrome_args.append(f"--proxy-server={NODELOC_PROXY}")
+
+        if LOW_MEMORY:
+            logger.info("已启用低内存模式")
+            chrome_args.extend(LOW_MEMORY_ARGS)
+
         # ARM64 修复:手动指定 chromium 路径
         chrome_candidates = [
             "/usr/bin/chromium",
@@ -232,11 +1707,65 @@ class NodeLocUpgrade:
             raise RuntimeError("未找到 Chrome/Chromium")
         
         logger.info(f"使用 Chrome 路径:{chrome_path}")
+
+        if BROWSER_BACKEND == "cdp":
+            self._start_cdp_browser(chrome_path, chrome_args)
+        else:
+            self._start_selenium_browser(chrome_path, chrome_args)
+
+        if BLOCK_RESOURCES:
+            self._apply_resource_blocking()
+
+        self.memory_watchdog.sample()
+        self.memory_watchdog.start()
+
+        self.driver.set_script_timeout(SCRIPT_TIMEOUT)
+        self.driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+        self.page_load_timeout = PAGE_LOAD_TIMEOUT
+
+        # 移除 webdriver 标识
+        try:
+            self.driver.execute_script(
+                "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+            )
+        except Exception:
+            pass
+
+    def _start_cdp_browser(self, chrome_path: str, chrome_args: list):
+        """直连 DevTools: 常驻模式连接调试地址, 否则以随机调试端口启动独立的 Chromium"""
+        try:
+            if self.warm_browser:
+                self._ensure_warm_chrome(chrome_path, chrome_args)
+                self.driver = CDPDriver.attach(CHROME_DEBUG_ADDRESS)
+            else:
+                self.driver = CDPDriver.launch(chrome_path, chrome_args)
+            logger.success(f"NodeLoc:Chrome 启动成功 (CDP 直连 {self.driver.address})")
+        except Exception as e:
+            logger.error(f"Chrome 启动失败:{e}")
+            raise
+
+    def _start_selenium_browser(self, chrome_path: str, chrome_args: list):
+        """经 chromedriver 启动 Chrome (常驻模式下连接调试地址)"""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
         options.binary_location = chrome_path
+        if BLOCK_RESOURCES and NET_STATS:
+            # 开启性能日志, 用于统计被屏蔽的请求与实际下载量
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        if self.warm_browser:
+            # 常驻模式: 启动参数在拉起 Chromium 时生效, 这里只需连接调试地址
+            self._ensure_warm_chrome(chrome_path, chrome_args)
+            options.debugger_address = CHROME_DEBUG_ADDRESS
+        else:
+            for arg in chrome_args:
+                options.add_argument(arg)
+            options.add_experimental_option("excludeSwitches", ["enable-automation"])
+            options.add_experimental_option("useAutomationExtension", False)
 
         try:
-            from selenium.webdriver.chrome.service import Service
-            
             chromedriver_candidates = [
                 "/usr/bin/chromedriver",
                 "/usr/local/bin/chromedriver",
@@ -261,79 +1790,436 @@ class NodeLocUpgrade:
             logger.error(f"Chrome 启动失败:{e}")
             raise
 
-        # 移除 webdriver 标识
+        if self.warm_browser:
+            self._open_warm_tab()
+
+    def _warm_chrome_alive(self) -> bool:
+        """常驻 Chromium 调试端口是否可用"""
+        try:
+            r = requests.get(f"http://{CHROME_DEBUG_ADDRESS}/json/version", timeout=2)
+            return r.status_code == 200
+        except Exception:
+            return False
+
+    def _ensure_warm_chrome(self, chrome_path: str, chrome_args: list):
+        """确保常驻 Chromium 正在运行, 未运行则启动 (脚本退出后保持运行)"""
+        if self._warm_chrome_alive():
+            logger.info(f"连接常驻 Chromium:{CHROME_DEBUG_ADDRESS}")
+            return
+
+        port = CHROME_DEBUG_ADDRESS.rpartition(":")[2]
+        os.makedirs(CHROME_PROFILE_DIR, exist_ok=True)
+        cmd = [
+            chrome_path,
+            *chrome_args,
+            f"--remote-debugging-port={port}",
+            f"--user-data-dir={CHROME_PROFILE_DIR}",
+            "about:blank",
+        ]
+        logger.info(f"启动常驻 Chromium:{CHROME_DEBUG_ADDRESS} (profile={CHROME_PROFILE_DIR})")
+        subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            if self._warm_chrome_alive():
+                return
+            time.sleep(0.2)
+        raise RuntimeError(f"常驻 Chromium 启动超时:{CHROME_DEBUG_ADDRESS}")
+
+    def _open_warm_tab(self):
+        """常驻模式: 清理上次残留的标签页, 为本次运行新开一个标签页"""
+        handles = self.driver.window_handles
+        # 保留第一个标签页, 避免关闭最后一个窗口导致浏览器退出
+        for handle in handles[1:]:
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except Exception:
+                pass
+        self.driver.switch_to.window(handles[0])
+        self.driver.switch_to.new_window("tab")
+
+    def _blocked_url_patterns(self) -> list:
+        """合并默认规则、资源类型规则与自定义规则, 并去掉 NODELOC_UNBLOCK_RULES 中列出的规则"""
+        if os.environ.get("NODELOC_ALLOW_URLS"):
+            logger.warning("NODELOC_ALLOW_URLS 已更名为 NODELOC_UNBLOCK_RULES (填写要移除的屏蔽规则原文),当前设置不生效")
+        patterns = list(DEFAULT_BLOCK_PATTERNS)
+        for rtype in BLOCK_RESOURCE_TYPES:
+            patterns.extend(RESOURCE_TYPE_PATTERNS.get(rtype, []))
+        patterns.extend(BLOCK_URL_PATTERNS)
+
+        result = []
+        for pattern in patterns:
+            if pattern not in result and pattern not in UNBLOCK_RULES:
+                result.append(pattern)
+        return result
+
+    def _apply_resource_blocking(self):
+        """通过 CDP 为当前会话设置资源屏蔽规则"""
+        patterns = self._blocked_url_patterns()
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            logger.info(f"已启用资源屏蔽:{len(patterns)} 条规则")
+        except Exception as e:
+            logger.warning(f"设置资源屏蔽失败:{e}")
+
+    def _collect_network_stats(self):
+        """读取性能日志, 累计被屏蔽的请求数与实际下载字节数"""
+        if not (BLOCK_RESOURCES and NET_STATS) or not self.driver:
+            return
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception as e:
+            logger.debug(f"读取性能日志失败:{e}")
+            return
+
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except Exception:
+                continue
+            method = message.get("method")
+            params = message.get("params") or {}
+            if method == "Network.loadingFailed" and params.get("blockedReason"):
+                rtype = (params.get("type") or "Other").lower()
+                self.net_stats["blocked"] += 1
+                self.net_stats["blocked_by_type"][rtype] = self.net_stats["blocked_by_type"].get(rtype, 0) + 1
+            elif method == "Network.loadingFinished":
+                self.net_stats["bytes_loaded"] += int(params.get("encodedDataLength") or 0)
+
+    def _browser_root_pids(self) -> list:
+        """浏览器进程树的根进程 (chromedriver; CDP 直连时为 Chromium 本身)"""
+        process = getattr(self.driver, "process", None)
+        if process:
+            return [process.pid]
         try:
-            self.driver.execute_script(
-                "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+            return [self.driver.service.process.pid]
+        except Exception:
+            return []
+
+    def quit_browser(self):
+        """关闭浏览器 (常驻模式下只关闭本次打开的标签页)"""
+        if not self.driver:
+            return
+
+        self.memory_watchdog.sample()
+        self.memory_watchdog.stop()
+        if self.memory_watchdog.peak_kb:
+            logger.info(self.memory_watchdog.summary())
+
+        self._collect_network_stats()
+        if BLOCK_RESOURCES and NET_STATS:
+            by_type = ", ".join(f"{k} {v}" for k, v in sorted(self.net_stats["blocked_by_type"].items()))
+            logger.info(
+                f"资源屏蔽:已屏蔽请求 {self.net_stats['blocked']} 个"
+                f"{f' ({by_type})' if by_type else ''}, "
+                f"实际下载 {self.net_stats['bytes_loaded'] / 1024:.0f} KB"
             )
+
+        try:
+            if self.warm_browser:
+                self.driver.close()
+            self.driver.quit()
         except Exception:
             pass
+        self.driver = None
+
+    def _browser_cookies(self) -> list:
+        """把 session 中的 Cookie 转为 CDP Network.CookieParam, 保留 domain/path/secure/过期时间/HttpOnly"""
+        scheme = urlparse(HOME_URL).scheme
+        cookies = []
+        for c in self.session.cookies.jar:
+            cookie = {
+                "name": c.name,
+                "value": c.value,
+                "path": c.path or "/",
+                "secure": bool(c.secure),
+                "httpOnly": self._cookie_http_only(c),
+            }
+            if c.domain_initial_dot:
+                cookie["domain"] = c.domain
+            else:
+                # 仅限当前主机的 Cookie 用 url 设置, 避免被扩大到子域名
+                cookie["url"] = f"{scheme}://{c.domain or urlparse(HOME_URL).hostname}{cookie['path']}"
+            if c.expires:
+                cookie["expires"] = c.expires
+            cookies.append(cookie)
+        return cookies
 
+    @timed_span("sync_cookie_to_browser")
     def sync_cookie_to_browser(self):
-        """同步 Cookie 到浏览器"""
+        """在首次导航前通过 CDP 一次性写入登录 Cookie, 第一次打开页面即为已登录状态"""
         logger.info("NodeLoc:同步 Cookie 到浏览器")
-        
+        cookies = self._browser_cookies()
+
         try:
-            self.driver.get(HOME_URL)
-            time.sleep(2)
+            self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+            logger.info(f"已设置 {len(cookies)} 个 Cookie")
+            return
+        except Exception as e:
+            logger.warning(f"CDP 设置 Cookie 失败,改为打开主页后逐个设置:{e}")
+
+        try:
+            self._open(HOME_URL)
         except Exception as e:
             logger.error(f"访问主页失败:{e}")
             self._save_debug("访问主页失败")
             raise
-        
-        # 设置 Cookie
-        for k, v in self.session.cookies.get_dict().items():
+
+        for cookie in cookies:
             try:
-                self.driver.add_cookie({"name": k, "value": v, "domain": ".nodeloc.com"})
+                self.driver.add_cookie({
+                    "name": cookie["name"],
+                    "value": cookie["value"],
+                    "path": cookie["path"],
+                    "secure": cookie["secure"],
+                    "httpOnly": cookie["httpOnly"],
+                    **({"domain": cookie["domain"]} if "domain" in cookie else {}),
+                    **({"expiry": int(cookie["expires"])} if "expires" in cookie else {}),
+                })
             except Exception as e:
-                logger.warning(f"设置 Cookie {k} 失败:{e}")
-        
-        logger.info(f"已设置 {len(self.session.cookies)} 个 Cookie")
+                logger.warning(f"设置 Cookie {cookie['name']} 失败:{e}")
+
+        logger.info(f"已设置 {len(cookies)} 个 Cookie")
+
+    def _ensure_browser(self):
+        """按需启动浏览器 (http 引擎下仅在需要 DOM 时启动)"""
+        if self.driver:
+            return
+        with self.budget.phase("start_browser"):
+            self.start_browser()
+            self.sync_cookie_to_browser()
+
+    def _open(self, url: str):
+        """打开页面, 页面加载超时限制在剩余运行时间内 (与上次设置相同时不重复下发)"""
+        timeout = int(self.budget.clamp(PAGE_LOAD_TIMEOUT, floor=5))
+        if timeout != self.page_load_timeout:
+            self.driver.set_page_load_timeout(timeout)
+            self.page_load_timeout = timeout
+        self.driver.get(url)
+
+    def _wait_until(self, condition: str, timeout: float = 10) -> bool:
+        """等待页面 JS 条件成立, 条件满足立即返回, 超时返回 False"""
+        timeout = min(self.budget.clamp(timeout, floor=0.5), SCRIPT_TIMEOUT - 5)
+        try:
+            script = WAIT_CONDITION_JS.replace("__CONDITION__", condition)
+            return bool(self.driver.execute_async_script(script, int(timeout * 1000)))
+        except Exception as e:
+            logger.debug(f"等待页面条件失败:{e}")
+            return False
 
+    @timed_span("discourse_boot")
     def _wait_discourse_ready(self, timeout: int = 60):
         """等待 Discourse SPA 启动完成"""
         logger.info("等待 Discourse 应用启动...")
-        
-        for i in range(timeout):
-            try:
-                splash = self.driver.find_elements(By.CSS_SELECTOR, "#d-splash")
-                if not splash:
-                    logger.info(f"Discourse 启动完成(耗时 {i}秒)")
-                    return True
-                
-                if splash[0].value_of_css_property("display") == "none":
-                    logger.info(f"Discourse 启动完成(耗时 {i}秒)")
-                    return True
-                    
-            except Exception:
-                logger.info(f"Discourse 启动完成(耗时 {i}秒)")
-                return True
-            
-            time.sleep(1)
-        
+
+        start = time.time()
+        if self._wait_until(DISCOURSE_READY_JS, timeout):
+            logger.info(f"Discourse 启动完成(耗时 {time.time() - start:.1f}秒)")
+            return True
+
         logger.warning(f"等待 {timeout}秒后 Discourse 仍未完全启动")
         return False
 
     # ---------------- Sign ----------------
+    def _do_checkin_http(self):
+        """通过 API 签到, 返回 True/False; 接口不可用或返回无法识别时返回 None (改用浏览器签到)"""
+        for attempt in range(2):
+            # 沿用登录时取得的 CSRF Token, 只有被拒绝 (BAD CSRF) 时才重新获取
+            try:
+                csrf = self.csrf_token if attempt == 0 and self.csrf_token else self._fetch_csrf(referer=HOME_URL)
+            except Exception as e:
+                logger.warning(f"获取 CSRF 异常:{e}")
+                return None
+            if not csrf:
+                return None
+
+            headers = {
+                "X-Requested-With": "XMLHttpRequest",
+                "X-CSRF-Token": csrf,
+                "Referer": f"{HOME_URL}/",
+                "Origin": HOME_URL,
+            }
+            try:
+                r = self.session.post(CHECKIN_URL, headers=headers, impersonate="chrome136", timeout=self.budget.clamp(15))
+            except Exception as e:
+                logger.warning(f"API 签到请求异常:{e}")
+                return None
+            if r.status_code == 403 and "BAD CSRF" in (r.text or "") and attempt == 0:
+                logger.debug("CSRF Token 已失效,重新获取")
+                continue
+            break
+
+        if r.status_code in (404, 405):
+            logger.warning(f"签到接口不可用 HTTP={r.status_code}")
+            return None
+
+        try:
+            j = r.json()
+        except Exception:
+            j = None
+        if not isinstance(j, dict):
+            logger.warning(f"签到接口返回的不是 JSON (HTTP={r.status_code}): {(r.text or '')[:200]}")
+            return None
+
+        detail = json.dumps(j, ensure_ascii=False)
+        if "已经签到" in detail or "已签到" in detail:
+            logger.success("NodeLoc:今天已签到 ✅")
+            return True
+
+        if r.status_code != 200 or j.get("errors") or j.get("error"):
+            logger.warning(f"API 签到失败 HTTP={r.status_code}: {j.get('errors') or j.get('error') or detail[:200]}")
+            return False
+
+        if j.get("success") in (True, "OK", "ok") or "成功" in str(j.get("message") or ""):
+            logger.success("NodeLoc:签到成功 ✅")
+            return True
+
+        logger.warning(f"无法识别签到接口返回:{detail[:200]}")
+        return None
+
+    def _checkin_status_http(self):
+        """从 current_user 的 NODELOC_CHECKIN_STATUS_FIELD 判断今日是否已签到, 返回 True/False; 未配置或字段不存在时返回 None"""
+        if not CHECKIN_STATUS_FIELD:
+            return None
+        user = self._fetch_current_user()
+        if not user:
+            return None
+        if CHECKIN_STATUS_FIELD not in user:
+            logger.warning(f"current_user 中没有签到状态字段 {CHECKIN_STATUS_FIELD},直接执行签到")
+            return None
+        return bool(user[CHECKIN_STATUS_FIELD])
+
+    # ---------------- Trust level ----------------
+    def _fetch_progress(self):
+        """读取当前信任等级与累计数据 (/session/current.json + /u/<用户名>/summary.json), 失败返回 None"""
+        user = self._fetch_current_user()
+        if not user.get("username"):
+            return None
+        headers = {"X-Requested-With": "XMLHttpRequest", "Referer": f"{HOME_URL}/"}
+        try:
+            r = self.session.get(USER_SUMMARY_URL.format(username=user["username"]), headers=headers,
+                                 impersonate="chrome136", timeout=self.budget.clamp(10))
+            if r.status_code != 200:
+                return None
+            summary = (r.json() or {}).get("user_summary") or {}
+        except Exception as e:
+            logger.debug(f"获取信任等级进度失败:{e}")
+            return None
+
+        fields = {key for requirement in TRUST_LEVEL_REQUIREMENTS.values() for key in requirement}
+        return {
+            "trust_level": int(user.get("trust_level") or 0),
+            "summary": {key: summary[key] for key in fields if key in summary},
+        }
+
+    def _plan_tasks(self):
+        """按信任等级进度缩减今日任务 (进度每天只查询一次, 缓存在检查点中); 查询失败时按 DAILY_TASKS 全量执行"""
+        self.tasks = dict(DAILY_TASKS)
+        progress = self.checkpoint.get("progress")
+        if not progress:
+            progress = self._fetch_progress()
+            if not progress:
+                logger.info("未获取到信任等级进度,按完整任务执行")
+                return
+            self.checkpoint["progress"] = progress
+            self._save_checkpoint()
+
+        level = progress["trust_level"]
+        if level >= TARGET_TRUST_LEVEL:
+            logger.info(f"🎖️ 当前信任等级 TL{level},已达到目标 TL{TARGET_TRUST_LEVEL},今日只签到")
+            self.tasks = dict.fromkeys(DAILY_TASKS, 0)
+            return
+        requirement = TRUST_LEVEL_REQUIREMENTS.get(level + 1)
+        if not requirement:
+            logger.info(f"🎖️ 当前信任等级 TL{level},TL{level + 1} 的要求无法从个人统计判断,按完整任务执行")
+            return
+
+        # 进度是当天首次查询的快照, 扣除今天已完成的运行做掉的部分 (帖子数与阅读时间按主题数估算)
+        summary = dict(progress["summary"])
+        done = self.checkpoint.get("totals") or {}
+        topics_done = done.get("topics_browsed", 0)
+        for key, value in (
+            ("topics_entered", topics_done),
+            ("posts_read_count", topics_done * POSTS_PER_TOPIC),
+            ("time_read", topics_done * READ_SECONDS_PER_TOPIC),
+            ("likes_given", done.get("likes_given", 0)),
+            ("post_count", done.get("replies_posted", 0)),
+        ):
+            summary[key] = (summary.get(key) or 0) + value
+        missing = {key: max(0, need - (summary.get(key) or 0)) for key, need in requirement.items()}
+        likes = missing.get("likes_given", 0)
+        replies = missing.get("post_count", 0)
+        topics = max(
+            missing.get("topics_entered", 0),
+            -(-missing.get("posts_read_count", 0) // POSTS_PER_TOPIC),
+            -(-missing.get("time_read", 0) // READ_SECONDS_PER_TOPIC),
+            -(-likes // 2),  # 每个主题最多点赞 2 次
+            replies * 3,  # 约 30% 的主题会回复
+        )
+        planned = {
+            "topics_to_browse": topics,
+            "posts_to_read": missing.get("posts_read_count", 0),
+            "likes_to_give": likes,
+            "replies_to_post": replies,
+        }
+        self.tasks = {key: min(value, planned.get(key, value)) for key, value in DAILY_TASKS.items()}
+
+        pending = ", ".join(f"{key} 差 {value}" for key, value in missing.items() if value) or "无"
+        logger.info(f"🎖️ 当前信任等级 TL{level},距 TL{level + 1}: {pending}")
+        if not any(self.tasks.values()):
+            logger.info("可由脚本完成的要求均已达标,今日只签到")
+        elif self.tasks != DAILY_TASKS:
+            logger.info(
+                f"今日任务缩减为: 浏览 {self.tasks['topics_to_browse']} | "
+                f"点赞 {self.tasks['likes_to_give']} | 回复 {self.tasks['replies_to_post']}"
+            )
+
+    @timed_span("do_checkin")
     def do_checkin(self) -> bool:
         """执行签到"""
         logger.info("NodeLoc:开始签到")
 
+        # 先用已登录的 session 查询状态, 已签到就不必为此启动浏览器
+        if self._checkin_status_http():
+            logger.success("NodeLoc:今天已签到 ✅")
+            return True
+
+        if NODELOC_ENGINE == "http":
+            result = self._do_checkin_http()
+            if result is not None:
+                return result
+            logger.info("API 签到不可用,改用浏览器签到")
+
         try:
-            self.driver.get(HOME_URL)
+            self._ensure_browser()
+            self._open(HOME_URL)
             self._wait_discourse_ready(timeout=60)
-            time.sleep(3)
+            self._wait_until("document.querySelector('button.checkin-button')", timeout=10)
             
             # 查找签到按钮
-            buttons = self.driver.find_elements(By.CSS_SELECTOR, "button.checkin-button")
+            buttons = self.driver.find_elements(BY_CSS, "button.checkin-button")
             if not buttons:
                 logger.warning("未找到签到按钮")
+                self._save_debug("未找到签到按钮")
                 return False
             
             button = buttons[0]
             logger.info("找到签到按钮,准备点击")
             button.click()
-            time.sleep(3)
+            # 等待按钮状态变为已签到
+            self._wait_until(
+                "(b => b && /已经签到|已签到|签✓/.test((b.title || '') + (b.getAttribute('aria-label') || '')))"
+                "(document.querySelector('button.checkin-button'))",
+                timeout=5,
+            )
 
             # 检查点击后的状态
             try:
@@ -356,61 +2242,113 @@ class NodeLocUpgrade:
             
         except Exception as e:
             logger.error(f"签到失败:{e}")
+            self._save_debug("签到失败")
             return False
 
     # ---------------- Upgrade Tasks ----------------
+    @staticmethod
+    def _topic_from_json(item: dict) -> dict:
+        """把 /latest.json 中的主题转换为内部格式"""
+        title = (item.get("title") or "").strip()
+        topic_id = item.get("id")
+        if not title or not topic_id:
+            return None
+        return {
+            "id": topic_id,
+            "title": title,
+            "url": f"{HOME_URL}/t/{item.get('slug') or 'topic'}/{topic_id}",
+            "posts_count": item.get("posts_count", 0),
+            "bumped_at": item.get("bumped_at"),
+        }
+
+    def _get_latest_topics_http(self, limit: int = 20) -> list:
+        """通过 /latest.json 获取最新主题列表 (启用缓存时按 ETag + bumped_at 游标增量拉取)"""
+        headers = {"X-Requested-With": "XMLHttpRequest", "Referer": f"{HOME_URL}/latest"}
+        cache = self.topic_cache
+        cursor = cache.get_meta("latest_cursor") if cache else None
+        newest = cursor
+        topics = []
+
+        for page in range(TOPIC_CACHE_MAX_PAGES if cache else 1):
+            url = f"{LATEST_JSON_URL}?page={page}" if page else LATEST_JSON_URL
+            page_headers = dict(headers)
+            if cache and page == 0:
+                if cache.get_meta("latest_etag"):
+                    page_headers["If-None-Match"] = cache.get_meta("latest_etag")
+                if cache.get_meta("latest_last_modified"):
+                    page_headers["If-Modified-Since"] = cache.get_meta("latest_last_modified")
+            try:
+                r = self.session.get(url, headers=page_headers, impersonate="chrome136", timeout=self.budget.clamp(15))
+                if r.status_code == 304:
+                    logger.info("主题列表无变化(304),使用本地缓存")
+                    break
+                if r.status_code != 200:
+                    logger.error(f"获取主题列表失败 HTTP={r.status_code}")
+                    break
+                items = ((r.json() or {}).get("topic_list") or {}).get("topics") or []
+            except Exception as e:
+                logger.error(f"获取主题列表失败:{e}")
+                break
+
+            if cache and page == 0:
+                cache.set_meta("latest_etag", r.headers.get("ETag") or "")
+                cache.set_meta("latest_last_modified", r.headers.get("Last-Modified") or "")
+
+            page_topics = [t for t in map(self._topic_from_json, items) if t]
+            topics.extend(page_topics)
+            if not cache:
+                break
+
+            changed = cache.upsert(page_topics)
+            logger.debug(f"第 {page + 1} 页: {len(page_topics)} 个主题, {changed} 个有变化")
+            # 置顶主题的 bumped_at 不代表列表位置, 不参与游标判断
+            bumped = [item.get("bumped_at") for item in items if item.get("bumped_at") and not item.get("pinned")]
+            if bumped:
+                newest = max([newest or ""] + bumped)
+            reached_cursor = not cursor or not bumped or min(bumped) <= cursor
+            if not items or (reached_cursor and len(cache.fresh_topics(limit)) >= limit):
+                break
+
+        if not cache:
+            topics = topics[:limit]
+            logger.info(f"共找到 {len(topics)} 个主题")
+            return topics
+
+        if newest and newest != cursor:
+            cache.set_meta("latest_cursor", newest)
+        fresh = cache.fresh_topics(limit)
+        logger.info(f"共找到 {len(fresh)} 个待浏览主题 (本次拉取 {len(topics)} 个)")
+        return fresh
+
+    @timed_span("get_latest_topics")
     def get_latest_topics(self, limit: int = 20) -> list:
-        """获取最新主题列表"""
+        """获取最新主题列表 (启用主题缓存时无论哪种引擎都走 /latest.json 增量拉取, 不为列表打开页面)"""
+        if NODELOC_ENGINE == "http" or self.topic_cache:
+            return self._get_latest_topics_http(limit)
+
         try:
-            self.driver.get(f"{HOME_URL}/latest")
+            self._ensure_browser()
+            self._open(f"{HOME_URL}/latest")
             self._wait_discourse_ready(timeout=30)
-            time.sleep(3)
+            self._wait_until("document.querySelector('.topic-list-item, .topic-list tbody tr')", timeout=10)
             
-            topics = []
-            selectors = [
+            selectors = self.selectors.order("topic_row", [
                 ".topic-list-item",
                 ".topic-list tbody tr",
                 "tr.topic-list-item",
-            ]
-            
-            topic_elements = []
-            for selector in selectors:
-                topic_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                if topic_elements:
-                    logger.info(f"使用选择器 '{selector}' 找到 {len(topic_elements)} 个主题")
-                    break
-            
-            if not topic_elements:
+            ])
+            title_selectors = self.selectors.order("topic_title", [".title a", "a.title", ".main-link a"])
+
+            result = self.driver.execute_script(EXTRACT_TOPICS_JS, selectors, title_selectors, limit) or {}
+            if not result.get("selector"):
                 logger.warning("未找到主题列表")
+                self._save_debug("未找到主题列表")
                 return []
-            
-            for elem in topic_elements[:limit]:
-                try:
-                    # 查找标题链接
-                    title_elem = None
-                    title_selectors = [".title a", "a.title", ".main-link a"]
-                    
-                    for ts in title_selectors:
-                        try:
-                            title_elem = elem.find_element(By.CSS_SELECTOR, ts)
-                            if title_elem:
-                                break
-                        except Exception:
-                            continue
-                    
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.text.strip()
-                    url = title_elem.get_attribute("href")
-                    
-                    if title and url:
-                        topics.append({"title": title, "url": url})
-                        
-                except Exception as e:
-                    logger.debug(f"解析主题失败:{e}")
-                    continue
-            
+            self.selectors.record("topic_row", result["selector"])
+            self.selectors.record("topic_title", result.get("titleSelector"))
+
+            logger.info(f"使用选择器 '{result['selector']}' 找到 {result['total']} 个主题")
+            topics = result.get("topics") or []
             logger.info(f"共找到 {len(topics)} 个主题")
             return topics
             
@@ -418,13 +2356,35 @@ class NodeLocUpgrade:
             logger.error(f"获取主题列表失败:{e}")
             return []
 
-    @retry_decorator(retries=2, delay=2)
+    def _route_in_app(self, topic: dict, timeout: float = 15) -> bool:
+        """通过 Discourse 客户端路由切换到主题, 成功返回 True; 不可用或超时返回 False (调用方整页加载)"""
+        if not SPA_NAVIGATION:
+            return False
+        path = urlparse(topic["url"]).path
+        timeout = self.budget.clamp(timeout)
+        try:
+            routed = self.driver.execute_async_script(SPA_ROUTE_JS, int(timeout * 1000), path, topic.get("id"))
+        except Exception as e:
+            logger.debug(f"站内路由失败,改用整页加载:{e}")
+            return False
+        if routed is None:
+            return False
+        if not routed:
+            logger.debug("站内路由等待超时,改用整页加载")
+        return bool(routed)
+
+    @timed_span("browse_topic")
+    @retry_decorator(retries=3, delay=2)
     def browse_topic(self, topic: dict) -> bool:
-        """浏览单个主题（带智能滚动）"""
+        """浏览单个主题（带智能滚动）; 网络类错误向上抛出, 交给重试与断路器处理"""
         try:
             logger.info(f"浏览主题: {topic['title'][:40]}...")
-            self.driver.get(topic["url"])
-            self._wait_discourse_ready(timeout=30)
+            if not self._route_in_app(topic):
+                self._open(topic["url"])
+                net_error = self.driver.execute_script(NET_ERROR_JS)
+                if net_error:
+                    raise ConnectionError(f"net::{net_error}")
+                self._wait_discourse_ready(timeout=30)
             
             # 智能滚动浏览
             scroll_times = random.randint(3, 6)
@@ -447,83 +2407,55 @@ class NodeLocUpgrade:
                     break
                 
                 time.sleep(random.uniform(1, 3))
-            
+
+            # 及时读取性能日志, 避免日志缓冲堆积
+            self._collect_network_stats()
             self.stats['topics_browsed'] += 1
             self.stats['posts_read'] += 1
             
             return True
         except Exception as e:
+            if is_transient_error(e):
+                raise
             logger.debug(f"浏览主题失败:{e}")
             return False
 
+    @timed_span("like_posts_in_topic")
     def like_posts_in_topic(self, max_likes: int = 2) -> int:
         """在当前主题中点赞帖子"""
         liked_count = 0
         try:
-            # 等待页面加载完成
-            time.sleep(2)
-            
-            # 方法1: 尝试点击 discourse-reactions-reaction-button (实际的反应按钮容器)
-            reaction_buttons = self.driver.find_elements(By.CSS_SELECTOR, ".discourse-reactions-reaction-button")
-            
-            if reaction_buttons:
-                logger.debug(f"找到 {len(reaction_buttons)} 个反应按钮容器")
-                
-                for btn in reaction_buttons[:max_likes]:
-                    try:
-                        # 检查是否已点赞
-                        classes = btn.get_attribute("class") or ""
-                        if "has-reaction" in classes.lower() or "reacted" in classes.lower():
-                            logger.debug("该帖子已点赞，跳过")
-                            continue
-                        
-                        # 滚动到按钮可见
-                        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
-                        time.sleep(0.5)
-                        
-                        # 使用 JavaScript 点击（避免被遮挡）
-                        self.driver.execute_script("arguments[0].click();", btn)
-                        time.sleep(random.uniform(1, 2))
-                        liked_count += 1
-                        self.stats['likes_given'] += 1
-                        logger.info(f"👍 点赞成功 ({self.stats['likes_given']})")
-                        
-                        if self.stats['likes_given'] >= DAILY_TASKS['likes_to_give']:
-                            break
-                            
-                    except Exception as e:
-                        logger.debug(f"点赞反应按钮失败:{e}")
-                        continue
-                
-                return liked_count
+            # 等待帖子流渲染完成
+            self._wait_until("document.querySelector('.topic-post')", timeout=10)
             
+            # 方法1: discourse-reactions-reaction-button (实际的反应按钮容器)
             # 方法2: 如果没有找到反应按钮，尝试传统点赞按钮
-            like_selectors = [
-                "button[title*='赞']",
-                "button.like-button",
-                "button.toggle-like",
-                ".post-controls button.like"
-            ]
-            
-            like_buttons = []
-            for selector in like_selectors:
-                like_buttons = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                if like_buttons:
-                    logger.debug(f"使用选择器 '{selector}' 找到 {len(like_buttons)} 个点赞按钮")
-                    break
-            
-            if not like_buttons:
+            reaction_liked = ["has-reaction", "reacted"]
+            like_liked = ["liked", "has-like"]
+            liked_classes = {
+                ".discourse-reactions-reaction-button": reaction_liked,
+                "button[title*='赞']": like_liked,
+                "button.like-button": like_liked,
+                "button.toggle-like": like_liked,
+                ".post-controls button.like": like_liked,
+            }
+            like_groups = [[sel, liked_classes[sel]] for sel in self.selectors.order("like_button", list(liked_classes))]
+
+            # 一次调用完成查找与已点赞状态筛选
+            result = self.driver.execute_script(FIND_LIKE_BUTTONS_JS, like_groups, max_likes) or {}
+            if not result.get("selector"):
                 logger.debug("未找到点赞按钮")
                 return 0
-            
-            for btn in like_buttons[:max_likes]:
+            self.selectors.record("like_button", result["selector"])
+
+            like_buttons = result.get("buttons") or []
+            logger.debug(f"使用选择器 '{result['selector']}' 找到 {result['total']} 个点赞按钮")
+            skipped = min(result["total"], max_likes) - len(like_buttons)
+            if skipped:
+                logger.debug(f"{skipped} 个帖子已点赞，跳过")
+
+            for btn in like_buttons:
                 try:
-                    # 检查是否已点赞
-                    classes = btn.get_attribute("class") or ""
-                    if "liked" in classes.lower() or "has-like" in classes.lower():
-                        logger.debug("该帖子已点赞，跳过")
-                        continue
-                    
                     # 滚动到按钮可见
                     self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", btn)
                     time.sleep(0.5)
@@ -535,7 +2467,7 @@ class NodeLocUpgrade:
                     self.stats['likes_given'] += 1
                     logger.info(f"👍 点赞成功 ({self.stats['likes_given']})")
                     
-                    if self.stats['likes_given'] >= DAILY_TASKS['likes_to_give']:
+                    if self.stats['likes_given'] >= self.tasks['likes_to_give']:
                         break
                         
                 except Exception as e:
@@ -547,36 +2479,30 @@ class NodeLocUpgrade:
             logger.debug(f"点赞功能异常:{e}")
             return 0
 
+    @timed_span("reply_to_topic")
     def reply_to_topic(self, topic: dict) -> bool:
         """回复主题"""
         try:
             logger.info(f"回复主题: {topic['title'][:40]}...")
             
-            # 等待页面完全加载
-            time.sleep(3)
+            # 等待回复按钮渲染
+            self._wait_until(
+                "document.querySelector('button.reply, button[title*=\"回复\"]')", timeout=10
+            )
             
             # 查找回复按钮（尝试多种选择器）
-            reply_btn = None
-            reply_selectors = [
+            reply_selectors = self.selectors.order("reply_button", [
                 "button.reply.create",
                 "button.reply",
                 ".topic-footer-main-buttons button.reply",
                 "button[title*='回复']"
-            ]
-            
-            for selector in reply_selectors:
-                try:
-                    buttons = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    if buttons:
-                        reply_btn = buttons[0]
-                        logger.debug(f"使用选择器 '{selector}' 找到回复按钮")
-                        break
-                except Exception:
-                    continue
-            
+            ])
+            selector, reply_btn = self.driver.execute_script(FIRST_MATCH_JS, reply_selectors)
             if not reply_btn:
                 logger.warning("未找到回复按钮")
                 return False
+            self.selectors.record("reply_button", selector)
+            logger.debug(f"使用选择器 '{selector}' 找到回复按钮")
             
             # 滚动到回复按钮可见
             try:
@@ -585,7 +2511,6 @@ class NodeLocUpgrade:
                 
                 # 使用 JavaScript 点击（避免被遮挡）
                 self.driver.execute_script("arguments[0].click();", reply_btn)
-                time.sleep(3)
             except Exception as e:
                 logger.error(f"点击回复按钮失败:{e}")
                 return False
@@ -593,10 +2518,8 @@ class NodeLocUpgrade:
             # 查找编辑器
             try:
                 # 等待编辑器出现
-                wait = WebDriverWait(self.driver, 10)
-                editor = wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".d-editor-input"))
-                )
+                self._wait_until("document.querySelector('.d-editor-input')", timeout=10)
+                editor = self.driver.find_element(BY_CSS, ".d-editor-input")
                 
                 # 滚动到编辑器
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", editor)
@@ -608,8 +2531,17 @@ class NodeLocUpgrade:
                 editor.send_keys(reply_text)
                 time.sleep(2)
                 
-                # 查找提交按钮
-                submit_btn = self.driver.find_element(By.CSS_SELECTOR, "button.create")
+                # 查找提交按钮 (限定在编辑器内, 避免命中页脚的 button.reply.create)
+                submit_selectors = self.selectors.order("reply_submit", [
+                    "#reply-control button.create",
+                    "#reply-control .save-or-cancel button",
+                    "button.create",
+                ])
+                selector, submit_btn = self.driver.execute_script(FIRST_MATCH_JS, submit_selectors)
+                if not submit_btn:
+                    logger.warning("未找到提交按钮")
+                    return False
+                self.selectors.record("reply_submit", selector)
                 
                 # 滚动到提交按钮
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", submit_btn)
@@ -617,7 +2549,14 @@ class NodeLocUpgrade:
                 
                 # 使用 JavaScript 点击提交按钮
                 self.driver.execute_script("arguments[0].click();", submit_btn)
-                time.sleep(3)
+
+                # 等待编辑器收起 (提交完成)
+                if not self._wait_until(
+                    "(c => !c || c.classList.contains('closed') || !c.querySelector('.d-editor-input'))"
+                    "(document.querySelector('#reply-control'))",
+                    timeout=10,
+                ):
+                    logger.debug("提交后编辑器未收起")
                 
                 self.stats['replies_posted'] += 1
                 logger.success(f"回复成功: {reply_text}")
@@ -629,6 +2568,7 @@ class NodeLocUpgrade:
                 
         except Exception as e:
             logger.error(f"回复主题失败:{e}")
+            self._save_debug("回复主题失败")
             return False
 
     def auto_upgrade_tasks(self):
@@ -637,42 +2577,87 @@ class NodeLocUpgrade:
         logger.info(f"🚀 开始执行升级任务")
         logger.info(f"{'='*50}")
         
-        # 1. 获取主题列表
+        # 1. 获取主题列表 (跳过检查点中今日已处理的主题)
+        if not self.tasks['topics_to_browse']:
+            logger.info("今日无需浏览主题,跳过升级任务")
+            self._save_checkpoint(completed=True)
+            return
+        remaining = self.tasks['topics_to_browse'] - self.stats['topics_browsed']
+        if remaining <= 0:
+            logger.info("今日浏览任务已在上次运行中完成,跳过升级任务")
+            self._save_checkpoint(completed=True)
+            return
+
         logger.info("📋 获取最新主题列表...")
-        topics = self.get_latest_topics(DAILY_TASKS['topics_to_browse'])
+        processed = set(self.checkpoint["processed"])
+        topics = [
+            t for t in self.get_latest_topics(remaining + len(processed))
+            if self._topic_key(t) not in processed
+        ][:remaining]
         
         if not topics:
             logger.warning("未找到主题,跳过升级任务")
             return
         
-        # 2. 浏览主题并点赞
+        # 2. 浏览主题并点赞 (浏览/点赞/回复需要 DOM)
+        if self.budget.remaining() < TOPIC_ESTIMATE:
+            logger.warning("剩余运行时间不足,跳过主题处理")
+            return
+        self._ensure_browser()
+        breaker = CircuitBreaker()
+        out_of_time = False
+        durations = []
         for i, topic in enumerate(topics, 1):
+            # 时间不够再处理一个主题时提前结束, 保证通知与退出有时间完成
+            estimate = sum(durations) / len(durations) if durations else TOPIC_ESTIMATE
+            if self.budget.remaining() < estimate:
+                logger.warning(f"剩余运行时间不足,跳过剩余 {len(topics) - i + 1} 个主题")
+                out_of_time = True
+                break
+            topic_start = time.time()
             try:
                 logger.info(f"[{i}/{len(topics)}] 处理主题...")
                 
                 # 浏览主题
                 if self.browse_topic(topic):
+                    breaker.success()
+                    if self.topic_cache and topic.get("id"):
+                        self.topic_cache.mark_visited(topic["id"])
+
                     # 点赞（控制频率）
-                    if self.stats['likes_given'] < DAILY_TASKS['likes_to_give']:
+                    if self.stats['likes_given'] < self.tasks['likes_to_give']:
                         liked = self.like_posts_in_topic(max_likes=2)
                         if liked > 0:
                             logger.info(f"👍 点赞 {liked} 次 (总计:{self.stats['likes_given']})")
                     
                     # 回复（控制频率）
-                    if self.stats['replies_posted'] < DAILY_TASKS['replies_to_post']:
+                    if self.stats['replies_posted'] < self.tasks['replies_to_post']:
                         # 只回复部分主题（随机选择）
                         if random.random() < 0.3:  # 30% 概率回复
                             if self.reply_to_topic(topic):
                                 logger.info(f"💬 回复成功 (总计:{self.stats['replies_posted']})")
+
+                self.checkpoint["processed"].append(self._topic_key(topic))
+                self._save_checkpoint()
+                durations.append(time.time() - topic_start)
                 
                 # 随机延迟
                 if i < len(topics):
                     delay = random.uniform(5, 10)
-                    time.sleep(delay)
+                    time.sleep(self.budget.clamp(delay, floor=0))
                 
             except Exception as e:
                 logger.warning(f"处理主题时出错: {e}")
+                # 失败的主题(含重试与页面加载超时)同样计入耗时估算
+                durations.append(time.time() - topic_start)
+                breaker.failure(e)
+                if breaker.open:
+                    logger.error(f"连续 {breaker.failures} 次网络故障,中止剩余 {len(topics) - i} 个主题")
+                    break
                 continue
+
+        # 被断路器或运行时限中止时保留未完成状态, 下次运行从断点继续
+        self._save_checkpoint(completed=not (breaker.open or out_of_time))
         
         # 3. 输出统计
         logger.info(f"\n{'='*50}")
@@ -692,91 +2677,129 @@ class NodeLocUpgrade:
             f"给出点赞: {self.stats['likes_given']}\n"
             f"发布回复: {self.stats['replies_posted']}"
         )
-        
-        # Telegram 通知
-        tg_notify(status_msg)
-        
-        # Gotify 通知
-        if GOTIFY_URL and GOTIFY_TOKEN:
-            try:
-                response = requests.post(
-                    f"{GOTIFY_URL}/message",
-                    params={"token": GOTIFY_TOKEN},
-                    json={
-                        "title": "NodeLoc 升级任务",
-                        "message": status_msg,
-                        "priority": 5
-                    },
-                    timeout=10,
-                    impersonate="chrome136"
-                )
-                response.raise_for_status()
-                logger.success("✅ Gotify 通知发送成功")
-            except Exception as e:
-                logger.warning(f"⚠️ Gotify 通知发送失败: {e}")
-        
-        # Server 酱³ 通知
-        if SC3_PUSH_KEY:
-            match = re.match(r"sct(\d+)t", SC3_PUSH_KEY, re.I)
-            if not match:
-                logger.warning("⚠️ SC3_PUSH_KEY 格式错误")
-            else:
-                uid = match.group(1)
-                url = f"https://{uid}.push.ft07.com/send/{SC3_PUSH_KEY}"
-                params = {"title": "NodeLoc 升级任务", "desp": status_msg}
-                
-                try:
-                    response = requests.get(url, params=params, timeout=10, impersonate="chrome136")
-                    response.raise_for_status()
-                    logger.success("✅ Server 酱³ 通知发送成功")
-                except Exception as e:
-                    logger.warning(f"⚠️ Server 酱³ 通知发送失败: {e}")
+        if self.driver:
+            self.memory_watchdog.sample()
+        if self.memory_watchdog.peak_kb:
+            status_msg += f"\n{self.memory_watchdog.summary()}"
+
+        # Telegram / Gotify / Server 酱³ / 自定义微信 并发推送
+        notify(status_msg)
+
+    # ---------------- Metrics ----------------
+    def _export_spans(self, run_start: float, exit_code: int):
+        """输出阶段耗时: 日志摘要 + JSON Lines + 可选 Prometheus textfile"""
+        run_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(run_start))
+        host = socket.gethostname()
+        total = round(time.time() - run_start, 3)
+
+        totals = {}
+        for span in self.spans:
+            totals[span["phase"]] = totals.get(span["phase"], 0) + span["duration"]
+        if totals:
+            logger.info("阶段耗时: " + " | ".join(f"{k} {v:.1f}s" for k, v in totals.items()))
 
-        # 自定义 WeChat API 通知
-        if WECHAT_API_URL and WECHAT_AUTH_TOKEN:
+        failures = [{"phase": span["phase"], "error": span["error"]} for span in self.spans if span.get("error")][:10]
+        append_history(
+            [{"run_id": run_id, "host": host, **span} for span in self.spans]
+            + [run_record(run_start, exit_code, self.run_error,
+                          stats=self.stats, phases={k: round(v, 3) for k, v in totals.items()},
+                          failures=failures, chrome_peak_rss_kb=self.memory_watchdog.peak_kb)]
+        )
+
+        if PROM_TEXTFILE:
+            counts = {}
+            for span in self.spans:
+                counts[span["phase"]] = counts.get(span["phase"], 0) + 1
+            lines = [
+                "# HELP nodeloc_phase_duration_seconds Wall-clock seconds spent per phase in the last run.",
+                "# TYPE nodeloc_phase_duration_seconds gauge",
+                *(f'nodeloc_phase_duration_seconds{{phase="{k}"}} {v:.3f}' for k, v in totals.items()),
+                "# HELP nodeloc_phase_calls Number of calls per phase in the last run.",
+                "# TYPE nodeloc_phase_calls gauge",
+                *(f'nodeloc_phase_calls{{phase="{k}"}} {v}' for k, v in counts.items()),
+                "# HELP nodeloc_run_duration_seconds Wall-clock seconds of the last run.",
+                "# TYPE nodeloc_run_duration_seconds gauge",
+                f"nodeloc_run_duration_seconds {total:.3f}",
+                "# HELP nodeloc_run_exit_code Exit code of the last run.",
+                "# TYPE nodeloc_run_exit_code gauge",
+                f"nodeloc_run_exit_code {exit_code}",
+                "# HELP nodeloc_chrome_peak_rss_bytes Peak RSS of the chromedriver/Chromium process tree in the last run.",
+                "# TYPE nodeloc_chrome_peak_rss_bytes gauge",
+                f"nodeloc_chrome_peak_rss_bytes {self.memory_watchdog.peak_kb * 1024}",
+                "# HELP nodeloc_run_last_timestamp_seconds Start time of the last run.",
+                "# TYPE nodeloc_run_last_timestamp_seconds gauge",
+                f"nodeloc_run_last_timestamp_seconds {run_start:.0f}",
+            ]
             try:
-                # 优先尝试 GET 请求 (参考 wxpush 常见用法)
-                params = {
-                    "token": WECHAT_AUTH_TOKEN,
-                    "title": "NodeLoc 升级任务",
-                    "content": status_msg
-                }
-                response = requests.get(WECHAT_API_URL, params=params, timeout=10, impersonate="chrome136")
-                
-                # 如果 GET 失败 (405 Method Not Allowed), 尝试 POST
-                if response.status_code == 405:
-                    logger.debug("自定义微信 GET 返回 405, 尝试 POST")
-                    response = requests.post(WECHAT_API_URL, json=params, timeout=10, impersonate="chrome136")
-                
-                if response.status_code >= 400:
-                     logger.warning(f"⚠️ 自定义微信通知 HTTP {response.status_code}: {response.text[:100]}")
-                else:
-                     logger.success("✅ 自定义微信通知发送成功")
+                # 先写临时文件再改名, 避免 node-exporter 读到半个文件
+                tmp = f"{PROM_TEXTFILE}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                os.replace(tmp, PROM_TEXTFILE)
             except Exception as e:
-                logger.warning(f"⚠️ 自定义微信通知发送失败: {e}")
+                logger.warning(f"写入 Prometheus textfile 失败:{e}")
 
     # ---------------- Run ----------------
-    def run(self) -> int:
+    def _browser_alive(self) -> bool:
         try:
-            logger.info("==== NodeLoc 快速升级脚本开始 ====")
+            return self.driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
 
-            # 1. 登录
-            if not self.login():
-                logger.error("NodeLoc:登录失败 ❌")
-                tg_notify("NodeLoc:登录失败 ❌")
-                return 2
+    def run(self, deadline: float = None) -> int:
+        """执行一次完整任务; deadline 为整次运行的总时长上限(秒), 默认 NODELOC_RUN_DEADLINE"""
+        run_start = time.time()
+        self.budget = RunBudget(RUN_DEADLINE if deadline is None else deadline)
+        self.spans = []
+        self.run_error = None
+        self.csrf_token = None
+        self.current_user = None
+        self.stats = dict.fromkeys(self.stats, 0)
+        self.net_stats = {"blocked": 0, "blocked_by_type": {}, "bytes_loaded": 0}
+        self.memory_watchdog.reset()
+        if self.driver and not self._browser_alive():
+            logger.warning("复用的浏览器已失效,本次运行重新启动")
+            self.quit_browser()
+        elif self.driver:
+            self.memory_watchdog.sample()
+            self.memory_watchdog.start()
+        exit_code = self._run()
+        self._export_spans(run_start, exit_code)
+        return exit_code
 
-            # 2. 启动浏览器
-            self.start_browser()
-            self.sync_cookie_to_browser()
+    def _run(self) -> int:
+        outbox_thread = None
+        try:
+            logger.info("==== NodeLoc 快速升级脚本开始 ====")
+            outbox_thread = flush_outbox_in_background()
+
+            # 1. 预检 (代理 + 登录), 只用 curl_cffi, 不导入 Selenium
+            with self.budget.phase("login"):
+                code = self.preflight()
+            if code:
+                return code
+            self._load_checkpoint()
+            self._plan_tasks()
+            if self.driver:
+                # 复用上次运行的浏览器, 登录态可能已更新
+                self.sync_cookie_to_browser()
 
-            # 3. 签到
-            self.do_checkin()
+            # 2. 签到 (检查点或 API 显示今日已签到则跳过, 浏览器只在真正需要 DOM 时才启动)
+            if self.checkpoint["checkin_done"]:
+                logger.info("检查点显示今日已签到,跳过签到")
+            elif self.budget.exhausted:
+                logger.warning("剩余运行时间不足,跳过签到")
+            else:
+                with self.budget.phase("checkin"):
+                    checked_in = self.do_checkin()
+                if checked_in:
+                    self.checkpoint["checkin_done"] = True
+                    self._save_checkpoint()
             
-            # 4. 执行升级任务
+            # 3. 执行升级任务
             self.auto_upgrade_tasks()
 
-            # 5. 发送通知
+            # 4. 发送通知
             self.send_notifications()
             
             summary = (
@@ -790,27 +2813,331 @@ class NodeLocUpgrade:
             logger.info("==== NodeLoc 快速升级脚本结束 ====")
             return 0
 
-        except Exception:
+        except Exception as e:
+            self.run_error = f"{type(e).__name__}: {e}"[:300]
             logger.error("NodeLoc:脚本异常 ❌")
             traceback.print_exc()
+            self._save_debug("脚本异常")
             tg_notify("NodeLoc:脚本异常 ❌")
             return 9
 
         finally:
+            if self.session_expires_at:
+                self._pull_browser_cookies()
+                self._save_session_cache()
+            if not self.keep_browser:
+                self.quit_browser()
+            elif self.driver:
+                # 保留浏览器等待下次运行, 两次运行之间不再采样内存
+                self.memory_watchdog.sample()
+                self.memory_watchdog.stop()
+            self.selectors.save()
+            self.debug_capture.flush()
+            if outbox_thread:
+                # 等补发结束并写回发件箱, 否则进程退出后已送达的通知会在下次运行重复发送
+                outbox_thread.join(NOTIFY_DEADLINE)
+                if outbox_thread.is_alive():
+                    logger.warning("发件箱补发未在时限内结束,未确认的通知将在下次运行重试")
+
+
+# ================== 运行历史报告 ==================
+def run_record(run_start: float, exit_code: int, reason: str = None, **extra) -> dict:
+    """运行历史中的一条 run 记录 (未设置账号等提前退出的情况也记录, 计入成功率)"""
+    return {
+        "run_id": time.strftime("%Y%m%d-%H%M%S", time.localtime(run_start)),
+        "host": socket.gethostname(), "phase": "run", "start": run_start,
+        "duration": round(time.time() - run_start, 3), "ok": exit_code == 0, "exit_code": exit_code,
+        "reason": reason or EXIT_REASONS.get(exit_code, f"退出码 {exit_code}"),
+        **extra,
+    }
+
+
+def append_history(records: list):
+    """追加写入 NODELOC_METRICS_FILE (JSON Lines)"""
+    if not METRICS_FILE:
+        return
+    try:
+        with open(METRICS_FILE, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.warning(f"写入阶段耗时失败:{e}")
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_history(path: str, since: float, until: float = None) -> tuple:
+    """读取 NODELOC_METRICS_FILE 中 [since, until) 内的记录, 返回 (运行记录列表, {阶段: [单次耗时]})"""
+    runs, phases = [], {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
             try:
-                if self.driver:
-                    self.driver.quit()
-            except Exception:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            start = record.get("start", 0)
+            if start < since or (until is not None and start >= until):
+                continue
+            if record.get("phase") == "run":
+                runs.append(record)
+                if "phases" not in record:
+                    # 未进入流程就退出 (如未设置账号), 只计入成功率, 不拉低耗时分布
+                    continue
+            phases.setdefault(record.get("phase"), []).append(record.get("duration") or 0)
+    return runs, phases
+
+
+def history_report(days: float = 7, path: str = METRICS_FILE, as_json: bool = False) -> int:
+    """最近 days 天的成功率与各阶段 p50/p95, 并与之前同样长度的基线期对比; 发现回归时返回 1"""
+    if not path or not os.path.exists(path):
+        logger.error(f"没有运行历史:{path or '未设置 NODELOC_METRICS_FILE'}")
+        return 2
+
+    now = time.time()
+    window_start = now - days * 86400
+    baseline_start = window_start - days * 86400
+    runs, phases = load_history(path, window_start)
+    baseline_runs, baseline = load_history(path, baseline_start, window_start)
+
+    ok = sum(1 for r in runs if r.get("ok"))
+    reasons = {}
+    for r in runs:
+        if not r.get("ok"):
+            reason = r.get("reason") or EXIT_REASONS.get(r.get("exit_code"), f"退出码 {r.get('exit_code')}")
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+    rows, regressions = [], []
+    for phase, durations in sorted(phases.items(), key=lambda item: (item[0] != "run", item[0])):
+        row = {
+            "phase": phase,
+            "count": len(durations),
+            "p50": round(_percentile(durations, 50), 3),
+            "p95": round(_percentile(durations, 95), 3),
+            "baseline_p50": None,
+        }
+        base = baseline.get(phase) or []
+        if len(base) >= REPORT_MIN_BASELINE_SAMPLES:
+            row["baseline_p50"] = round(_percentile(base, 50), 3)
+            if row["p50"] > row["baseline_p50"] * REPORT_REGRESSION_RATIO and row["p50"] - row["baseline_p50"] > 1:
+                regressions.append(row)
+        rows.append(row)
+
+    if as_json:
+        print(json.dumps({
+            "days": days, "runs": len(runs), "ok": ok, "baseline_runs": len(baseline_runs),
+            "failure_reasons": reasons, "phases": rows, "regressions": [r["phase"] for r in regressions],
+        }, ensure_ascii=False, indent=1))
+        return 1 if regressions else 0
+
+    print(f"最近 {days:g} 天: {len(runs)} 次运行, 成功 {ok} 次"
+          f"{f' ({ok / len(runs):.0%})' if runs else ''}, 基线期 {len(baseline_runs)} 次运行")
+    print(f"  {'阶段':<22}{'次数':>6}{'p50':>10}{'p95':>10}{'基线p50':>10}{'变化':>8}")
+    for row in rows:
+        base = row["baseline_p50"]
+        change = f"{(row['p50'] / base - 1):+.0%}" if base else "-"
+        print(f"  {row['phase']:<24}{row['count']:>6}{row['p50']:>9.2f}s{row['p95']:>9.2f}s"
+              f"{f'{base:.2f}s' if base is not None else '-':>10}{change:>8}")
+    for reason, count in sorted(reasons.items(), key=lambda item: -item[1]):
+        print(f"  失败原因: {reason} x{count}")
+    for row in regressions:
+        print(f"  ⚠️ 回归: {row['phase']} p50 {row['p50']:.2f}s, 基线 {row['baseline_p50']:.2f}s "
+              f"(x{row['p50'] / row['baseline_p50']:.2f})")
+    return 1 if regressions else 0
+
+
+# ================== 常驻模式 ==================
+class UpgradeDaemon:
+    """常驻进程: 复用已登录的 session (可选复用浏览器), 按内部时间表执行 run(), 并输出状态文件与健康检查接口"""
+
+    def __init__(self, upgrade: NodeLocUpgrade, schedule: str = SCHEDULE,
+                 status_file: str = STATUS_FILE, status_port: int = STATUS_PORT, deadline: float = RUN_DEADLINE):
+        self.upgrade = upgrade
+        self.deadline = deadline
+        self.schedule = self.parse_schedule(schedule)
+        self.status_file = status_file
+        self.status_port = status_port
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._http = None
+        self.status = {
+            "pid": os.getpid(),
+            "state": "starting",
+            "started_at": time.time(),
+            "schedule": [f"{h:02d}:{m:02d}" for h, m in self.schedule],
+            "runs": 0,
+            "failures": 0,
+            "last_run": None,
+            "next_run": None,
+        }
+
+    @staticmethod
+    def parse_schedule(text: str) -> list:
+        """'09:00,21:00' -> [(9, 0), (21, 0)]"""
+        times = set()
+        for item in text.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            hour, _, minute = item.partition(":")
+            hour, minute = int(hour), int(minute or 0)
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError(f"无效的时间:{item}")
+            times.add((hour, minute))
+        if not times:
+            raise ValueError("时间表为空")
+        return sorted(times)
+
+    def next_run(self, now: float = None) -> float:
+        now = datetime.datetime.fromtimestamp(now if now is not None else time.time())
+        candidates = []
+        for hour, minute in self.schedule:
+            at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if at <= now:
+                at += datetime.timedelta(days=1)
+            candidates.append(at)
+        return min(candidates).timestamp()
+
+    def _update_status(self, **fields):
+        with self._lock:
+            self.status.update(fields)
+            self.status["updated_at"] = time.time()
+            snapshot = json.dumps(self.status, ensure_ascii=False)
+        if not self.status_file:
+            return
+        try:
+            tmp = f"{self.status_file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.status_file)
+        except Exception as e:
+            logger.warning(f"写入状态文件失败:{e}")
+
+    def healthy(self) -> bool:
+        last = self.status["last_run"]
+        return self.status["state"] != "stopped" and (last is None or last["exit_code"] == 0)
+
+    def _start_status_server(self):
+        """本地健康检查: GET /health 返回 200/503, GET /status 返回完整状态"""
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path not in ("/health", "/status"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                with daemon._lock:
+                    body = json.dumps(
+                        daemon.status if path == "/status" else
+                        {"ok": daemon.healthy(), "state": daemon.status["state"], "last_run": daemon.status["last_run"]},
+                        ensure_ascii=False,
+                    ).encode("utf-8")
+                self.send_response(200 if path == "/status" or daemon.healthy() else 503)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
                 pass
 
+        self._http = ThreadingHTTPServer(("127.0.0.1", self.status_port), StatusHandler)
+        self._http.daemon_threads = True
+        threading.Thread(target=self._http.serve_forever, name="status-server", daemon=True).start()
+        logger.info(f"健康检查接口:http://127.0.0.1:{self._http.server_address[1]}/health")
+
+    def run_job(self):
+        started = time.time()
+        self._update_status(state="running", current_run_started_at=started)
+        try:
+            exit_code = self.upgrade.run(self.deadline)
+        except Exception as e:
+            logger.error(f"定时任务异常:{e}")
+            exit_code = 9
+        self._update_status(
+            state="idle",
+            current_run_started_at=None,
+            runs=self.status["runs"] + 1,
+            failures=self.status["failures"] + (exit_code != 0),
+            last_run={
+                "start": started,
+                "end": time.time(),
+                "exit_code": exit_code,
+                "stats": dict(self.upgrade.stats),
+            },
+        )
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"收到信号 {signum},当前任务结束后退出")
+        self.stop_event.set()
+
+    def serve_forever(self, run_now: bool = False) -> int:
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        if self.status_port:
+            self._start_status_server()
+        logger.info(f"常驻模式启动,时间表:{', '.join(self.status['schedule'])}")
+
+        try:
+            if run_now:
+                self.run_job()
+            while not self.stop_event.is_set():
+                next_at = self.next_run()
+                self._update_status(state="idle", next_run=next_at)
+                logger.info(f"下次运行:{time.strftime('%Y-%m-%d %H:%M', time.localtime(next_at))}")
+                # 分段等待, 避免休眠/校时后错过运行时间
+                while not self.stop_event.is_set() and time.time() < next_at:
+                    self.stop_event.wait(min(60, next_at - time.time()))
+                if not self.stop_event.is_set():
+                    self.run_job()
+        finally:
+            self.upgrade.keep_browser = False
+            self.upgrade.quit_browser()
+            self._update_status(state="stopped", next_run=None)
+            if self._http:
+                self._http.shutdown()
+        return 0
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NodeLoc 快速升级脚本 (不带参数时执行一次, 兼容青龙定时任务)")
+    parser.add_argument("--deadline", type=float, default=RUN_DEADLINE,
+                        help="每次运行的总时长上限(秒), 0 不限制 (默认 %(default)s)")
+    subcommands = parser.add_subparsers(dest="command")
+    subcommands.add_parser("run", help="执行一次 (默认)")
+    daemon_parser = subcommands.add_parser("daemon", help="常驻运行, 按内部时间表执行")
+    daemon_parser.add_argument("--schedule", default=SCHEDULE, help="每日运行时间, 逗号分隔 (默认 %(default)s)")
+    daemon_parser.add_argument("--status-port", type=int, default=STATUS_PORT, help="本地健康检查端口, 0 关闭")
+    daemon_parser.add_argument("--keep-browser", action="store_true", default=DAEMON_KEEP_BROWSER,
+                               help="两次运行之间保留浏览器 (更快, 但常驻占用内存)")
+    daemon_parser.add_argument("--run-now", action="store_true", help="启动后立即执行一次")
+    report_parser = subcommands.add_parser("report", help="运行历史: 成功率、各阶段 p50/p95 与回归检测")
+    report_parser.add_argument("--days", type=float, default=7, help="统计最近多少天 (默认 %(default)s), 之前同样长度为基线期")
+    report_parser.add_argument("--file", default=METRICS_FILE, help="运行历史文件 (默认 NODELOC_METRICS_FILE)")
+    report_parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        raise SystemExit(history_report(args.days, args.file, args.json))
+
     username = os.environ.get("NODELOC_USERNAME")
     password = os.environ.get("NODELOC_PASSWORD")
 
     if not username or not password:
         logger.error("请设置 NODELOC_USERNAME / NODELOC_PASSWORD")
         tg_notify("NodeLoc:未设置环境变量 ❌")
+        append_history([run_record(time.time(), 1)])
         raise SystemExit(1)
 
-    raise SystemExit(NodeLocUpgrade(username, password).run())
+    upgrade = NodeLocUpgrade(username, password)
+    if args.command == "daemon":
+        upgrade.keep_browser = args.keep_browser
+        daemon = UpgradeDaemon(upgrade, schedule=args.schedule, status_port=args.status_port, deadline=args.deadline)
+        raise SystemExit(daemon.serve_forever(run_now=args.run_now))
+
+    raise SystemExit(upgrade.run(args.deadline))
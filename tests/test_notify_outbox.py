@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""通知发件箱: 发件箱文件不可写时通知仍应立即发出"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fixture_server import FixtureServer  # noqa: E402
+
+CHANNEL_ENV = ("TG_BOT_TOKEN", "TG_CHAT_ID", "TG_API_BASE", "GOTIFY_URL", "GOTIFY_TOKEN",
+               "SC3_PUSH_KEY", "WECHAT_API_URL", "WECHAT_AUTH_TOKEN", "NODELOC_NOTIFY_OUTBOX")
+
+
+def load_script(env: dict):
+    """以指定环境变量加载脚本 (只启用 env 中配置的通知渠道)"""
+    for key in CHANNEL_ENV:
+        os.environ.pop(key, None)
+    os.environ.update(env)
+    spec = importlib.util.spec_from_file_location("nodeloc_upgrade", os.path.join(ROOT, "odeloc_upgrade_selenium.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class NotifyOutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.environ = dict(os.environ)
+        self.server = FixtureServer().start()
+        self.workdir = tempfile.mkdtemp(prefix="nodeloc-test-")
+
+    def tearDown(self):
+        self.server.stop()
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def _load(self, outbox: str, api_base: str = None):
+        return load_script({
+            "TG_BOT_TOKEN": "test",
+            "TG_CHAT_ID": "1",
+            "TG_API_BASE": api_base or self.server.url,
+            "NODELOC_NOTIFY_OUTBOX": outbox,
+        })
+
+    def test_unwritable_outbox_still_sends(self):
+        module = self._load(os.path.join(self.workdir, "missing", "outbox.json"))
+        self.assertEqual(module.notify("hello"), {"telegram": True})
+        self.assertEqual(self.server.requests.get("POST /bottest/sendMessage"), 1)
+
+    def test_only_failures_are_persisted(self):
+        outbox = os.path.join(self.workdir, "outbox.json")
+        module = self._load(outbox)
+        module.notify("hello")
+        self.assertFalse(os.path.exists(outbox))
+
+        module = self._load(outbox, api_base=self.server.url + "/unreachable")
+        self.assertEqual(module.notify("hello", deadline=5), {"telegram": False})
+        with open(outbox, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        self.assertEqual([(item["channel"], item["attempts"]) for item in items], [("telegram", 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()